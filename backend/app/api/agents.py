@@ -6,6 +6,7 @@ from ..models.schemas import (
     AgentCollaborationCreate, AgentCollaborationResponse
 )
 from ..services.agent_service import AgentService, get_agent_service
+from ..services.llm_usage import llm_usage_tracker
 from ..core.database import get_db
 
 router = APIRouter()
@@ -122,6 +123,14 @@ async def get_collaboration_status(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/agents/collaborations/{collaboration_id}/usage")
+async def get_collaboration_usage(collaboration_id: int):
+    """获取协作累计的LLM用量和成本"""
+    try:
+        return {"collaboration_id": collaboration_id, **llm_usage_tracker.get_collaboration_usage(collaboration_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/agents/collaborations/session/{session_id}")
 async def get_session_collaborations(
     session_id: str,
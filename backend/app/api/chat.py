@@ -11,6 +11,10 @@ from ..models.schemas import (
 )
 from ..services.conversation_service import ConversationService
 from ..services.media_service import media_service
+from ..services.llm_service import llm_service
+from ..services.llm_cache import llm_response_cache, embedding_cache
+from ..services.llm_usage import usage_context, llm_usage_tracker
+from ..services.context_packer import context_packer, MEMORY_BUDGET_RATIO
 from ..services.memory_service import MemoryService, get_memory_service
 from ..services.rag_service import RAGService, get_rag_service
 from ..services.agent_service import AgentService, get_agent_service
@@ -163,15 +167,12 @@ async def upload_file(
         if not media_service.validate_file_type(file.filename, allowed_types):
             raise HTTPException(status_code=400, detail="File type not allowed")
 
-        # 验证文件大小
-        file_size = 0
-        if hasattr(file, 'size'):
-            file_size = file.size
-        if not media_service.validate_file_size(file_size):
-            raise HTTPException(status_code=400, detail="File too large")
+        # 客户端声明了大小时提前拒绝，实际大小在流式写盘时强制校验
+        if getattr(file, 'size', None) and not media_service.validate_file_size(file.size):
+            raise HTTPException(status_code=413, detail="File too large")
 
         # 保存文件
-        file_path = await media_service.save_upload_file(file)
+        file_path, file_size, _ = await media_service.save_upload_stream(file)
         file_info = media_service.get_file_info(file_path)
 
         return FileUploadResponse(
@@ -179,11 +180,13 @@ async def upload_file(
             filename=os.path.basename(file_path),
             original_name=file.filename,
             file_type=file_info.get('extension', ''),
-            file_size=file_info.get('size', 0),
+            file_size=file_size,
             file_url=file_path,
             uploaded_at=datetime.utcnow()
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -229,16 +232,21 @@ async def enhanced_chat(
         rag_results = []
         agent_collaboration_result = None
 
+        memory_candidates = []
+        knowledge_candidates = []
+
         # 1. 记忆检索
         if request.use_memory:
             memory_context = await memory_service.get_relevant_context(
                 request.message, f"session_{request.conversation_id}"
             )
-            if memory_context.get("relevant_memories"):
-                context_parts.append("Memory Context:")
-                for mem in memory_context["relevant_memories"]:
-                    context_parts.append(f"- {mem['content']} (Type: {mem['type']}, Importance: {mem['importance']})")
-                memory_used = True
+            for mem in memory_context.get("relevant_memories", []):
+                memory_candidates.append({
+                    "kind": "memory",
+                    "content": mem["content"],
+                    "score": mem["importance"],
+                    "memory_type": mem["type"]
+                })
 
         # 2. RAG检索
         if request.use_rag and request.knowledge_base_ids:
@@ -250,10 +258,37 @@ async def enhanced_chat(
                 threshold=0.7
             )
             rag_results = await rag_service.search_knowledge_base(rag_search)
-            if rag_results:
-                context_parts.append("Knowledge Base Context:")
-                for i, result in enumerate(rag_results, 1):
-                    context_parts.append(f"[{i}] {result.content}")
+            for result in rag_results:
+                knowledge_candidates.append({
+                    "kind": "knowledge",
+                    "content": result.content,
+                    "score": result.score,
+                    "document_id": result.document_id,
+                    "chunk_index": result.chunk_index
+                })
+
+        # 按模型的token预算打包记忆和知识库上下文（去重、合并相邻块、按分数装填）
+        # 记忆按重要度、知识库按检索相似度排序，两者不在同一量纲，因此各自装填：
+        # 记忆最多占预算的MEMORY_BUDGET_RATIO，剩余预算留给知识库
+        budget = context_packer.budget_for_model(
+            request.model, request.max_tokens, context_packer.chunker.count_tokens(request.message)
+        )
+        memory_packing = context_packer.pack(memory_candidates, int(budget * MEMORY_BUDGET_RATIO))
+        knowledge_packing = context_packer.pack(knowledge_candidates, budget - memory_packing["tokens_used"])
+        context_tokens_saved = memory_packing["tokens_saved"] + knowledge_packing["tokens_saved"]
+
+        memory_items = memory_packing["items"]
+        if memory_items:
+            context_parts.append("Memory Context:")
+            for item in memory_items:
+                context_parts.append(f"- {item['content']} (Type: {item['memory_type']}, Importance: {item['score']})")
+            memory_used = True
+
+        knowledge_items = knowledge_packing["items"]
+        if knowledge_items:
+            context_parts.append("Knowledge Base Context:")
+            for i, item in enumerate(knowledge_items, 1):
+                context_parts.append(f"[{i}] {item['content']}")
 
         # 3. 多Agent协作
         if request.agent_collaboration and request.agents:
@@ -293,10 +328,12 @@ Please provide a comprehensive response considering all the context provided abo
 """
 
         # 5. 调用LLM
-        llm_response = await llm_service.chat_completion([
-            {"role": "system", "content": "You are an AI assistant with access to memory, knowledge bases, and multi-agent collaboration. Use all available context to provide the best possible response."},
-            {"role": "user", "content": enhanced_prompt}
-        ], model=request.model, max_tokens=request.max_tokens, temperature=request.temperature)
+        with usage_context(caller="chat.enhanced", conversation_id=request.conversation_id):
+            llm_response = await llm_service.chat_completion([
+                {"role": "system", "content": "You are an AI assistant with access to memory, knowledge bases, and multi-agent collaboration. Use all available context to provide the best possible response."},
+                {"role": "user", "content": enhanced_prompt}
+            ], model=request.model, max_tokens=request.max_tokens, temperature=request.temperature,
+                route="interactive")
 
         # 6. 存储到记忆系统
         if request.use_memory:
@@ -332,12 +369,13 @@ Please provide a comprehensive response considering all the context provided abo
             response=llm_response["content"],
             conversation_id=request.conversation_id,
             message_id=0,  # 实际应该从数据库获取
-            model_used=request.model,
+            model_used=llm_response.get("model_used", request.model),
             tokens_used=llm_response.get("tokens_used"),
             memory_used=memory_used,
             rag_results=rag_results,
             agent_collaboration=agent_collaboration_result,
-            processing_time=processing_time
+            processing_time=processing_time,
+            context_tokens_saved=context_tokens_saved
         )
 
     except Exception as e:
@@ -357,4 +395,87 @@ async def extract_conversation_memory(
         await memory_service.extract_and_store_conversation_memory(conversation_id, user_id)
         return {"message": "Memory extraction completed"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm/cache/stats")
+async def get_llm_cache_stats():
+    """
+    获取LLM响应缓存的命中统计
+    """
+    try:
+        return await llm_response_cache.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm/single-flight/stats")
+async def get_llm_single_flight_stats():
+    """
+    获取并发请求合并的统计
+    """
+    try:
+        return llm_service.get_single_flight_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm/scheduler/stats")
+async def get_llm_scheduler_stats():
+    """
+    获取各模型的并发、token预算和排队统计
+    """
+    try:
+        return llm_service.get_scheduler_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm/resilience/stats")
+async def get_llm_resilience_stats():
+    """
+    获取重试、对冲和熔断统计
+    """
+    try:
+        return llm_service.get_resilience_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm/embedding-cache/stats")
+async def get_embedding_cache_stats():
+    """
+    获取远程embedding缓存的命中统计
+    """
+    try:
+        return await embedding_cache.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm/usage")
+async def get_llm_usage(recent: int = 0):
+    """
+    获取LLM token用量、成本和延迟统计，recent>0时附带最近的调用记录
+    """
+    try:
+        summary = llm_service.get_usage_stats()
+        if recent > 0:
+            summary["recent"] = llm_usage_tracker.get_recent(recent)
+        return summary
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/conversations/{conversation_id}/usage")
+async def get_conversation_usage(conversation_id: int):
+    """
+    获取单个对话累计的LLM用量和成本
+    """
+    try:
+        return {"conversation_id": conversation_id, **llm_usage_tracker.get_conversation_usage(conversation_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm/router/stats")
+async def get_llm_router_stats():
+    """
+    获取模型路由的选择结果和各模型的延迟、错误率
+    """
+    try:
+        return llm_service.get_router_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -3,6 +3,9 @@ from typing import Optional
 from ..services.media_service import media_service
 from ..models.schemas import TranscriptionRequest, TranscriptionResponse, SpeechRequest, SpeechResponse, ImageAnalysisRequest, ImageAnalysisResponse
 from ..services.llm_service import llm_service
+from ..services.llm_usage import usage_context
+from ..services.tts_cache import tts_cache
+from ..services.image_preprocessor import image_preprocessor
 from fastapi.responses import FileResponse
 import os
 from datetime import datetime
@@ -17,7 +20,8 @@ async def transcribe_audio(
     转录音频文件
     """
     try:
-        result = await llm_service.transcribe_audio(request.audio_url, request.language)
+        with usage_context(caller="media"):
+            result = await llm_service.transcribe_audio(request.audio_url, request.language)
         return TranscriptionResponse(
             text=result["text"],
             language=result["language"],
@@ -58,7 +62,8 @@ async def text_to_speech(
     文本转语音
     """
     try:
-        audio_file_path = await llm_service.text_to_speech(request.text, request.voice)
+        with usage_context(caller="media"):
+            audio_file_path = await llm_service.text_to_speech(request.text, request.voice)
 
         return SpeechResponse(
             audio_url=audio_file_path,
@@ -95,7 +100,8 @@ async def analyze_image(
     分析图像
     """
     try:
-        result = await llm_service.analyze_image(request.image_url, request.prompt)
+        with usage_context(caller="media"):
+            result = await llm_service.analyze_image(request.image_url, request.prompt)
 
         return ImageAnalysisResponse(
             analysis=result["analysis"],
@@ -124,7 +130,8 @@ async def analyze_uploaded_image(
         processed_path, image_info = await media_service.process_image(file_path)
 
         # 分析图像
-        result = await llm_service.analyze_image(processed_path, prompt)
+        with usage_context(caller="media"):
+            result = await llm_service.analyze_image(processed_path, prompt)
 
         return ImageAnalysisResponse(
             analysis=result["analysis"],
@@ -155,4 +162,24 @@ async def get_image_file(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Image file not found")
 
-    return FileResponse(file_path)
\ No newline at end of file
+    return FileResponse(file_path)
+
+@router.get("/tts/cache/stats")
+async def get_tts_cache_stats():
+    """
+    获取语音合成缓存的命中统计
+    """
+    try:
+        return tts_cache.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/images/preprocess/stats")
+async def get_image_preprocess_stats():
+    """
+    获取图像预处理和缓存统计
+    """
+    try:
+        return image_preprocessor.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,19 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..models.schemas import (
     KnowledgeBaseCreate, KnowledgeBaseResponse, RAGSearchRequest,
     RAGSearchResult, DocumentUploadRequest
 )
-from ..services.rag_service import RAGService, get_rag_service
-from ..core.database import get_db
+from ..services.rag_service import RAGService, get_rag_service, SUPPORTED_DOCUMENT_TYPES
+from ..services.media_service import media_service
+from ..services.answer_cache import rag_answer_cache
+from ..services.bulk_import_service import bulk_import_service
+from ..services.text_chunker import text_chunker
 from ..core.config import settings
-import os
-import uuid
-from fastapi.responses import FileResponse
+from ..core.database import get_db
+from fastapi.responses import FileResponse, StreamingResponse
+import json
 
 router = APIRouter()
 
+def _sse_event(event: str, data) -> str:
+    """格式化一条server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _validate_chunk_params(chunk_size: int, chunk_overlap: int):
+    """分块参数不合法时直接返回400，不保存文件也不进入入库流程"""
+    try:
+        text_chunker.validate_params(chunk_size, chunk_overlap)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _require_knowledge_base(db: Session, kb_id: int):
+    """知识库不存在时直接返回404，不再逐个文件失败"""
+    if not get_rag_service(db).knowledge_base_exists(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+
 @router.post("/knowledge-bases", response_model=KnowledgeBaseResponse)
 async def create_knowledge_base(
     kb_data: KnowledgeBaseCreate,
@@ -47,23 +66,15 @@ async def upload_document_to_kb(
     db: Session = Depends(get_db)
 ):
     """上传文档到知识库"""
+    _validate_chunk_params(chunk_size, chunk_overlap)
     try:
         # 验证文件类型
-        allowed_types = ['pdf', 'docx', 'txt', 'md', 'html']
         file_extension = file.filename.split('.')[-1].lower()
-        if file_extension not in allowed_types:
+        if file_extension not in SUPPORTED_DOCUMENT_TYPES:
             raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_extension}")
 
-        # 保存文件
-        upload_dir = os.path.join(settings.upload_dir, "documents")
-        os.makedirs(upload_dir, exist_ok=True)
-
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(upload_dir, unique_filename)
-
-        with open(file_path, 'wb') as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # 流式保存文件（分块写盘，边写边计算哈希并校验大小）
+        file_path, _, content_hash = await media_service.save_upload_stream(file, "documents")
 
         # 处理文档
         upload_request = DocumentUploadRequest(
@@ -75,16 +86,67 @@ async def upload_document_to_kb(
 
         rag_service = get_rag_service(db)
         result = await rag_service.upload_document(
-            upload_request, file_path, file.filename, file_extension
+            upload_request, file_path, file.filename, file_extension, content_hash
         )
 
         return {
             "message": "Document uploaded successfully",
             "document_id": result["document_id"],
             "filename": result["filename"],
-            "chunk_count": result["chunk_count"]
+            "chunk_count": result["chunk_count"],
+            "deduplicated": result["deduplicated"]
         }
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/knowledge-bases/{kb_id}/import")
+async def import_archive_to_kb(
+    kb_id: int,
+    file: UploadFile = File(...),
+    chunk_size: int = Form(1000),
+    chunk_overlap: int = Form(200),
+    db: Session = Depends(get_db)
+):
+    """批量导入zip/tar压缩包中的文档到知识库"""
+    _validate_chunk_params(chunk_size, chunk_overlap)
+    _require_knowledge_base(db, kb_id)
+    archive_path = None
+    try:
+        archive_path, _, _ = await media_service.save_upload_stream(
+            file, "archives", max_size=settings.max_archive_size
+        )
+        return await bulk_import_service.import_archive(archive_path, kb_id, chunk_size, chunk_overlap)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if archive_path:
+            await media_service.delete_file(archive_path)
+
+@router.post("/knowledge-bases/{kb_id}/import-directory")
+async def import_directory_to_kb(
+    kb_id: int,
+    directory: str = Form(...),
+    chunk_size: int = Form(1000),
+    chunk_overlap: int = Form(200),
+    db: Session = Depends(get_db)
+):
+    """从服务器目录批量导入文档到知识库（仅限 bulk_import_allowed_dirs 中的目录）"""
+    _validate_chunk_params(chunk_size, chunk_overlap)
+    _require_knowledge_base(db, kb_id)
+    try:
+        return await bulk_import_service.import_directory(directory, kb_id, chunk_size, chunk_overlap)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -106,6 +168,7 @@ async def generate_rag_response(
     knowledge_base_ids: Optional[List[int]] = Form(None),
     limit: int = Form(5),
     threshold: float = Form(0.7),
+    neighbor_window: int = Form(0),
     model: str = Form("gpt-3.5-turbo"),
     db: Session = Depends(get_db)
 ):
@@ -113,26 +176,112 @@ async def generate_rag_response(
     try:
         rag_service = get_rag_service(db)
 
-        # 搜索相关文档
         search_request = RAGSearchRequest(
             query=query,
             knowledge_base_ids=knowledge_base_ids or [],
             limit=limit,
-            threshold=threshold
+            threshold=threshold,
+            neighbor_window=neighbor_window
         )
 
-        search_results = await rag_service.search_knowledge_base(search_request)
+        # 检索并生成响应（语义缓存命中时直接返回）
+        return await rag_service.answer_query(search_request, model=model)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/knowledge-bases/generate-response/stream")
+async def stream_rag_response(
+    request: Request,
+    query: str,
+    knowledge_base_ids: Optional[List[int]] = Form(None),
+    limit: int = Form(5),
+    threshold: float = Form(0.7),
+    neighbor_window: int = Form(0),
+    model: str = Form("gpt-3.5-turbo"),
+    db: Session = Depends(get_db)
+):
+    """流式生成RAG增强响应（SSE）：先发送检索到的来源，再逐段发送生成的文本"""
+    try:
+        rag_service = get_rag_service(db)
 
-        # 生成响应
-        response = await rag_service.generate_rag_response(
-            query, search_results, model=model
+        search_request = RAGSearchRequest(
+            query=query,
+            knowledge_base_ids=knowledge_base_ids or [],
+            limit=limit,
+            threshold=threshold,
+            neighbor_window=neighbor_window
         )
 
-        return response
+        cached, cache_key = await rag_service.lookup_cached_answer(search_request, model)
+        search_results = [] if cached else await rag_service.search_knowledge_base(search_request)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def cached_stream():
+        # 回放与实时流相同格式的sources和done事件
+        response = cached["response"]
+        sources = response.get("sources", [])
+        yield _sse_event("sources", sources)
+        yield _sse_event("token", {"content": response["response"]})
+        yield _sse_event("done", {
+            "response": response["response"],
+            "sources_used": len(sources),
+            "model_used": response.get("model_used", model),
+            "cached": True
+        })
+
+    async def event_stream():
+        # 来源取自实际放入提示的打包结果，与回答中的[i]引用编号一致
+        sources = []
+        events = rag_service.stream_rag_response(query, search_results, model=model)
+        try:
+            async for event in events:
+                # 客户端已断开则停止，finally中关闭上游生成
+                if await request.is_disconnected():
+                    return
+                if event["type"] == "sources":
+                    sources = event["sources"]
+                    yield _sse_event("sources", sources)
+                    continue
+                if event["type"] == "delta":
+                    yield _sse_event("token", {"content": event["content"]})
+                    continue
+
+                yield _sse_event("done", {
+                    "response": event["content"],
+                    "sources_used": len(sources),
+                    "model_used": event["model_used"],
+                    "tokens_used": event["usage"],
+                    "timing": event["timing"],
+                    "cached": False
+                })
+
+                # 缓存条目与非流式回答的格式一致，两个接口共用同一缓存
+                rag_service.cache_answer(cache_key, {
+                    "response": event["content"],
+                    "sources": sources,
+                    "sources_used": len(sources),
+                    "model_used": event["model_used"],
+                    "tokens_used": (event["usage"] or {}).get("total_tokens")
+                })
+        except Exception as e:
+            yield _sse_event("error", {"message": str(e)})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        cached_stream() if cached else event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/cache/stats")
+async def get_answer_cache_stats():
+    """获取RAG语义缓存命中统计"""
+    return rag_answer_cache.get_stats()
+
 @router.get("/knowledge-bases/{kb_id}/stats")
 async def get_knowledge_base_stats(
     kb_id: int,
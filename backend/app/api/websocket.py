@@ -3,7 +3,8 @@ from typing import Dict, List
 import json
 import asyncio
 from ..services.llm_service import llm_service
-from ..services.conversation_service import ConversationService
+from ..services.llm_usage import usage_context
+from ..services.conversation_context import conversation_context_manager
 from ..core.database import SessionLocal
 from ..models.schemas import WebSocketMessage
 
@@ -98,14 +99,11 @@ async def handle_chat_message(websocket: WebSocket, client_id: str, payload: dic
 
         # 获取数据库会话
         db = SessionLocal()
-        conversation_service = ConversationService(db)
 
         try:
             # 构建消息历史
-            messages = []
             if conversation_id:
-                messages = conversation_service.get_conversation_messages(conversation_id)
-                message_history = [{"role": msg.role, "content": msg.content} for msg in messages]
+                message_history = conversation_context_manager.build_messages(db, conversation_id)
             else:
                 message_history = [{"role": "user", "content": message}]
 
@@ -116,32 +114,38 @@ async def handle_chat_message(websocket: WebSocket, client_id: str, payload: dic
             }, client_id)
 
             # 获取LLM响应
-            llm_response = await llm_service.chat_completion(
-                messages=message_history,
-                model=model,
-                stream=True
-            )
-
-            response_content = ""
-            for chunk in llm_response:
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    response_content += content
+            with usage_context(caller="websocket.chat", conversation_id=conversation_id):
+                llm_response = await llm_service.chat_completion(
+                    messages=message_history,
+                    model=model,
+                    stream=True
+                )
+
+            try:
+                async for event in llm_response:
+                    if event["type"] != "delta":
+                        continue
 
                     await manager.send_personal_message({
                         "type": "chat_chunk",
-                        "data": {"content": content}
+                        "data": {"content": event["content"]}
                     }, client_id)
 
                     # 添加小延迟以显示流式效果
                     await asyncio.sleep(0.01)
+            finally:
+                # 客户端断开时退出订阅，没有其他订阅者时上游流随之关闭
+                await llm_response.aclose()
 
             # 发送完成消息
             await manager.send_personal_message({
                 "type": "chat_complete",
                 "data": {
-                    "response": response_content,
-                    "conversation_id": conversation_id
+                    "response": llm_response.text,
+                    "conversation_id": conversation_id,
+                    "model_used": llm_response.model_used,
+                    "tokens_used": llm_response.usage,
+                    "timing": llm_response.get_timing()
                 }
             }, client_id)
 
@@ -167,7 +171,8 @@ async def handle_audio_transcription(websocket: WebSocket, client_id: str, paylo
             "data": {"message": "正在转录音频..."}
         }, client_id)
 
-        result = await llm_service.transcribe_audio(audio_url, language)
+        with usage_context(caller="websocket.media"):
+            result = await llm_service.transcribe_audio(audio_url, language)
 
         await manager.send_personal_message({
             "type": "transcription_complete",
@@ -196,7 +201,8 @@ async def handle_image_analysis(websocket: WebSocket, client_id: str, payload: d
             "data": {"message": "正在分析图像..."}
         }, client_id)
 
-        result = await llm_service.analyze_image(image_url, prompt)
+        with usage_context(caller="websocket.media"):
+            result = await llm_service.analyze_image(image_url, prompt)
 
         await manager.send_personal_message({
             "type": "analysis_complete",
@@ -1,11 +1,16 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List, Dict, Any
 import os
 
 class Settings(BaseSettings):
     # OpenAI Configuration
     openai_api_key: str
     openai_base_url: str = "https://api.openai.com/v1"
+    openai_max_connections: int = 100  # 连接池最大连接数，即每个worker的最大并发请求数
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry: float = 30.0  # 空闲连接保持时间（秒）
+    openai_timeout: float = 60.0
+    openai_connect_timeout: float = 10.0
 
     # Database Configuration
     database_url: str = "sqlite:///./llm_agent.db"
@@ -23,6 +28,76 @@ class Settings(BaseSettings):
     # File Upload Configuration
     upload_dir: str = "uploads"
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    upload_chunk_size: int = 1024 * 1024  # 流式写盘的分块大小 1MB
+
+    # Bulk Import Configuration
+    max_archive_size: int = 1024 * 1024 * 1024  # 1GB
+    bulk_import_concurrency: int = 4
+    bulk_import_allowed_dirs: List[str] = []  # 允许从服务器目录导入的根目录，为空时禁用
+    parse_cache_max_bytes: int = 512 * 1024 * 1024  # 解析结果缓存上限 512MB，0表示禁用
+    image_cache_max_bytes: int = 256 * 1024 * 1024  # 预处理后图像的缓存上限 256MB，0表示禁用
+    image_jpeg_quality: int = 85  # 图像分析前重新编码的JPEG质量
+    tts_cache_max_bytes: int = 1024 * 1024 * 1024  # 语音合成缓存上限 1GB，0表示不限制
+    tts_cache_max_age_seconds: int = 30 * 24 * 3600  # 超过该时长未使用的合成结果被删除，0表示不过期
+
+    # Conversation Context Window Configuration
+    context_recent_turns: int = 10  # 原样发送的最近轮数（一问一答为一轮）
+    context_recent_max_tokens: int = 3000  # 原样发送的消息的token上限
+    context_summary_max_tokens: int = 500  # 滚动摘要的长度上限
+    context_summary_input_max_tokens: int = 6000  # 单次摘要更新最多并入的消息token数
+    context_summary_model: str = "gpt-3.5-turbo"
+
+    # LLM Admission Configuration
+    llm_default_max_concurrency: int = 16  # 每个模型的最大并发请求数
+    llm_default_tokens_per_minute: int = 0  # 每个模型每分钟token预算，0表示不限制
+    llm_model_limits: Dict[str, Dict[str, int]] = {}  # 按模型覆盖，如 {"gpt-4": {"max_concurrency": 4, "tokens_per_minute": 40000}}
+    llm_queue_timeout_seconds: float = 120.0
+
+    # LLM Retry / Hedging / Circuit Breaker Configuration
+    llm_max_retries: int = 2
+    llm_retry_base_delay: float = 0.5  # 指数退避的基础延迟（秒）
+    llm_retry_max_delay: float = 8.0
+    llm_hedging_enabled: bool = False  # 超过p95延迟时发出对冲请求
+    llm_circuit_failure_threshold: int = 5  # 连续失败多少次后熔断
+    llm_circuit_reset_seconds: float = 30.0
+    llm_fallback_models: Dict[str, str] = {}  # 熔断或重试耗尽时的备用模型，如 {"gpt-4": "gpt-3.5-turbo"}
+
+    # LLM Model Routing Configuration
+    llm_router_enabled: bool = True
+    # 路由类别 -> 备用模型列表和排序策略（ordered / fastest / fastest_under_slo），调用方指定的模型参与排序，变慢或不健康时让位
+    llm_routes: Dict[str, Dict[str, Any]] = {
+        "interactive": {"models": ["gpt-3.5-turbo", "gpt-4o-mini"], "policy": "fastest_under_slo", "slo_ms": 4000},
+        "agent": {"models": ["gpt-3.5-turbo", "gpt-4o-mini"], "policy": "fastest_under_slo", "slo_ms": 20000},
+    }
+    llm_router_window_seconds: float = 300.0  # 统计延迟和错误率的滑动窗口
+    llm_router_min_samples: int = 10  # 样本不足时不按延迟和错误率判断
+    llm_router_max_error_rate: float = 0.5  # 错误率超过该值视为不健康
+
+    # LLM Usage Accounting Configuration
+    llm_model_pricing: Dict[str, Dict[str, float]] = {}  # 覆盖内置单价（美元/1K token），如 {"gpt-4": {"prompt": 0.03, "completion": 0.06}}
+
+    # Remote Embedding Configuration
+    embedding_batch_size: int = 256  # 每个请求最多包含的文本数
+    embedding_batch_max_tokens: int = 100000  # 每个请求最多包含的token数
+    embedding_batch_concurrency: int = 4
+    embedding_cache_max_entries: int = 100000
+    embedding_cache_ttl_seconds: int = 30 * 24 * 3600
+
+    # 合并并发的相同LLM/embedding请求
+    llm_single_flight_enabled: bool = True
+
+    # LLM Response Cache Configuration
+    llm_cache_enabled: bool = True
+    llm_cache_backend: str = "memory"  # memory 或 sqlite
+    llm_cache_path: str = "llm_cache.db"  # sqlite后端的数据库文件
+    llm_cache_ttl_seconds: int = 86400
+    llm_cache_max_entries: int = 5000
+
+    # RAG Answer Cache Configuration
+    rag_cache_enabled: bool = True
+    rag_cache_similarity_threshold: float = 0.95
+    rag_cache_ttl_seconds: int = 3600
+    rag_cache_max_entries: int = 1000
 
     class Config:
         env_file = ".env"
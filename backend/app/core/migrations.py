@@ -0,0 +1,131 @@
+import logging
+from typing import Dict, List, Set, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from ..models.models import Base, KnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+# create_all只创建不存在的表，不会给已有表补列；模型中后来新增的列登记在这里
+# 表名 -> [(列名, 列定义)]
+ADDED_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "documents": [
+        ("content_hash", "VARCHAR"),
+        ("chunk_size", "INTEGER"),
+        ("chunk_overlap", "INTEGER"),
+        ("source_document_id", "INTEGER REFERENCES documents(id)"),
+        ("content_blob", "VARCHAR"),
+    ],
+    "knowledge_bases": [
+        ("document_count", "INTEGER DEFAULT 0"),
+        ("chunk_count", "INTEGER DEFAULT 0"),
+        ("document_type_counts", "JSON"),
+        ("generation", "INTEGER DEFAULT 0"),
+    ],
+}
+
+# 新增后需要按已有文档重新计算的知识库计数列
+KNOWLEDGE_BASE_COUNTER_COLUMNS = {
+    "knowledge_bases.document_count",
+    "knowledge_bases.chunk_count",
+    "knowledge_bases.document_type_counts",
+}
+
+# 每批迁移到压缩存储的旧文档数量
+CONTENT_BACKFILL_BATCH_SIZE = 100
+
+
+def _add_missing_columns(connection: Connection) -> Set[str]:
+    """给已有的表补上缺失的列，返回新增的 "表名.列名" """
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    added: Set[str] = set()
+
+    for table, columns in ADDED_COLUMNS.items():
+        if table not in existing_tables:
+            continue
+        present = {column["name"] for column in inspector.get_columns(table)}
+        for name, definition in columns:
+            if name in present:
+                continue
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+            added.add(f"{table}.{name}")
+            logger.info(f"Added column {table}.{name}")
+
+    return added
+
+
+def _create_missing_indexes(connection: Connection):
+    """create_all同样不会给已有的表补建索引，按模型定义逐个补建"""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            # 列尚未迁移时跳过，避免建索引失败
+            if all(column.name in present for column in index.columns):
+                index.create(bind=connection, checkfirst=True)
+
+
+def _rebuild_knowledge_base_counters(engine: Engine):
+    """计数列刚加上时全部为0，按已有文档为每个知识库重建一次"""
+    from ..services.rag_service import RAGService
+
+    db = Session(bind=engine)
+    try:
+        rag_service = RAGService(db)
+        for knowledge_base in db.query(KnowledgeBase).all():
+            rag_service._rebuild_knowledge_base_counters(knowledge_base)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _backfill_content_blobs(engine: Engine) -> int:
+    """把旧数据内联在content列中的全文移到压缩存储，返回迁移的文档数"""
+    from ..services.blob_store import text_blob_store
+
+    migrated = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                text(
+                    "SELECT id, content FROM documents "
+                    "WHERE content_blob IS NULL AND content IS NOT NULL "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"limit": CONTENT_BACKFILL_BATCH_SIZE}
+            ).fetchall()
+            if not rows:
+                return migrated
+
+            for document_id, content in rows:
+                connection.execute(
+                    text("UPDATE documents SET content_blob = :blob, content = NULL WHERE id = :id"),
+                    {"blob": text_blob_store.put(content), "id": document_id}
+                )
+            migrated += len(rows)
+
+
+def run_migrations(engine: Engine) -> Set[str]:
+    """在create_all之后执行，使旧数据库的表结构与模型一致；可重复执行"""
+    with engine.begin() as connection:
+        added = _add_missing_columns(connection)
+        _create_missing_indexes(connection)
+
+    if added & KNOWLEDGE_BASE_COUNTER_COLUMNS:
+        _rebuild_knowledge_base_counters(engine)
+        logger.info("Rebuilt knowledge base counters")
+
+    migrated = _backfill_content_blobs(engine)
+    if migrated:
+        logger.info(f"Moved inline text of {migrated} documents to the blob store")
+
+    return added
@@ -8,9 +8,12 @@ from dotenv import load_dotenv
 
 from .core.config import settings
 from .core.database import get_db, engine
+from .core.migrations import run_migrations
+from .core.upload_limit import UploadSizeLimitMiddleware
 from .models.models import Base
 from .api import chat, media, memory, rag, agents
 from .api.websocket import handle_websocket_chat, manager
+from .services.llm_service import llm_service
 
 # 加载环境变量
 load_dotenv()
@@ -18,12 +21,22 @@ load_dotenv()
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
 
+# 补齐旧数据库中缺失的列和索引
+run_migrations(engine)
+
 app = FastAPI(
     title="增强多模态LLM Agent API",
     description="具备记忆系统、RAG增强和多Agent协作的智能AI助手API",
     version="2.0.0"
 )
 
+# 在解析请求体之前限制上传大小（压缩包导入单独限制）
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.max_file_size,
+    path_limits={r"^/api/rag/knowledge-bases/\d+/import$": settings.max_archive_size}
+)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -95,6 +108,7 @@ async def shutdown_event():
     关闭事件
     """
     print("LLM Agent API shutting down...")
+    await llm_service.aclose()
 
 if __name__ == "__main__":
     uvicorn.run(
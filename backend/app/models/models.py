@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float, JSON, LargeBinary
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float, JSON, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from .database import Base
 
@@ -40,6 +40,16 @@ class Message(Base):
 
     conversation = relationship("Conversation", back_populates="messages")
 
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), unique=True, index=True)
+    summary = Column(Text, default="")  # 较早消息的滚动摘要
+    summarized_until_message_id = Column(Integer, default=0)  # 已并入摘要的最后一条消息ID
+    summarized_message_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class AgentSession(Base):
     __tablename__ = "agent_sessions"
 
@@ -114,6 +124,11 @@ class KnowledgeBase(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # 入库/删除时增量维护的统计计数
+    document_count = Column(Integer, default=0)
+    chunk_count = Column(Integer, default=0)
+    document_type_counts = Column(JSON, nullable=True)  # {"pdf": 3, "txt": 1}
+    generation = Column(Integer, default=0)  # 内容每次变化时递增，用于使缓存失效
 
     user = relationship("User", backref="knowledge_bases")
 
@@ -126,7 +141,12 @@ class Document(Base):
     original_name = Column(String)
     file_path = Column(String)
     file_type = Column(String)
-    content = Column(Text, nullable=True)
+    content = deferred(Column(Text, nullable=True))  # 旧数据的内联全文，仅在显式访问时加载
+    content_blob = Column(String, index=True, nullable=True)  # 压缩存储的全文（TextBlobStore键）
+    content_hash = Column(String, index=True, nullable=True)  # 文件内容SHA-256，用于去重
+    chunk_size = Column(Integer, nullable=True)
+    chunk_overlap = Column(Integer, nullable=True)
+    source_document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)  # 共享文本、块和向量的原始文档
     chunk_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -146,6 +166,11 @@ class DocumentChunk(Base):
 
     document = relationship("Document", backref="chunks")
 
+    # 相邻块扩展按 (document_id, chunk_index) 做范围查询
+    __table_args__ = (
+        Index("ix_document_chunks_document_chunk_index", "document_id", "chunk_index"),
+    )
+
 # 多Agent系统模型
 class Agent(Base):
     __tablename__ = "agents"
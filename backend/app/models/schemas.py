@@ -204,8 +204,8 @@ class KnowledgeBaseResponse(BaseModel):
 class DocumentUploadRequest(BaseModel):
     knowledge_base_id: int
     file_path: str
-    chunk_size: int = 1000
-    chunk_overlap: int = 200
+    chunk_size: int = 1000  # 以token计
+    chunk_overlap: int = 200  # 以token计
 
 class DocumentResponse(BaseModel):
     id: int
@@ -226,6 +226,8 @@ class RAGSearchRequest(BaseModel):
     limit: int = 5
     threshold: float = 0.7
     filters: Optional[Dict[str, Any]] = None
+    neighbor_window: int = 0  # 每个命中块前后各扩展的相邻块数
+    max_context_tokens: Optional[int] = None  # 扩展后结果的总token上限
 
 class RAGSearchResult(BaseModel):
     content: str
@@ -346,4 +348,5 @@ class EnhancedChatResponse(BaseModel):
     memory_used: bool = False
     rag_results: Optional[List[RAGSearchResult]] = None
     agent_collaboration: Optional[Dict[str, Any]] = None
-    processing_time: Optional[float] = None
\ No newline at end of file
+    processing_time: Optional[float] = None
+    context_tokens_saved: Optional[int] = None
\ No newline at end of file
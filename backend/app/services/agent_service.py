@@ -10,6 +10,7 @@ from ..models.schemas import (
     AgentCollaborationCreate, AgentCollaborationResponse, CollaborationType
 )
 from ..services.llm_service import llm_service
+from ..services.llm_usage import usage_context
 from ..services.memory_service import MemoryService
 import logging
 
@@ -58,7 +59,7 @@ class ResearcherAgent(BaseAgent):
         response = await llm_service.chat_completion([
             {"role": "system", "content": "You are an expert research agent."},
             {"role": "user", "content": research_prompt}
-        ])
+        ], cache=True, priority="agent", route="agent")
 
         return {
             "type": "research",
@@ -96,7 +97,7 @@ class AnalystAgent(BaseAgent):
         response = await llm_service.chat_completion([
             {"role": "system", "content": "You are an expert data analyst."},
             {"role": "user", "content": analysis_prompt}
-        ])
+        ], cache=True, priority="agent", route="agent")
 
         return {
             "type": "analysis",
@@ -133,7 +134,7 @@ class WriterAgent(BaseAgent):
         response = await llm_service.chat_completion([
             {"role": "system", "content": f"You are a professional {style} writer."},
             {"role": "user", "content": writing_prompt}
-        ])
+        ], priority="agent", route="agent")
 
         return {
             "type": "writing",
@@ -342,7 +343,8 @@ class AgentService:
             raise Exception(f"Agent {agent_id} not found or not active")
 
         try:
-            result = await agent_instance.execute_task(task_data)
+            with usage_context(caller=f"agent.{type(agent_instance).__name__}"):
+                result = await agent_instance.execute_task(task_data)
             return {"success": True, "output": result}
         except Exception as e:
             logger.error(f"Error executing agent task: {e}")
@@ -363,7 +365,8 @@ class AgentService:
             # 执行任务
             agent_instance = self.agent_instances.get(task.agent_id)
             if agent_instance:
-                result = await agent_instance.execute_task(task.task_data)
+                with usage_context(caller=f"agent.{type(agent_instance).__name__}"):
+                    result = await agent_instance.execute_task(task.task_data)
 
                 task.result = {"success": True, "output": result}
                 task.status = TaskStatus.COMPLETED
@@ -431,7 +434,9 @@ class AgentService:
                 }
             )
 
-            result = await self.execute_agent_task(coordinator_task.agent_id, coordinator_task.task_data)
+            # 协作中各Agent的LLM用量都归到该协作下
+            with usage_context(collaboration_id=collaboration_id):
+                result = await self.execute_agent_task(coordinator_task.agent_id, coordinator_task.task_data)
 
             collaboration.result = result
             collaboration.status = "completed"
@@ -0,0 +1,117 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from ..core.config import settings
+
+
+class SemanticAnswerCache:
+    """
+    RAG回答的语义缓存
+
+    以查询embedding做近似匹配，分组键为 (知识库ID, 模型, 检索参数)。
+    命中要求：相似度不低于阈值、未超过TTL、且相关知识库的generation与缓存时一致。
+    """
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: int = 3600,
+                 max_entries: int = 1000):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # 按最近使用排序
+        self._groups: Dict[Tuple, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    @staticmethod
+    def make_group_key(knowledge_base_ids: List[int], model: str, **params) -> Tuple:
+        """构建分组键：知识库ID与顺序无关"""
+        return (tuple(sorted(set(knowledge_base_ids))), model, tuple(sorted(params.items())))
+
+    def lookup(self, group_key: Tuple, embedding: np.ndarray,
+               generations: Dict[int, int]) -> Optional[Dict[str, Any]]:
+        """查找语义相近的缓存回答"""
+        with self._lock:
+            self._stats["lookups"] += 1
+            now = time.time()
+
+            best_id, best_score = None, -1.0
+            for entry_id in list(self._groups.get(group_key, [])):
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl_seconds or entry["generations"] != generations:
+                    # 过期或知识库已变化，直接淘汰
+                    self._remove(entry_id)
+                    self._stats["stale"] += 1
+                    continue
+
+                score = float(np.dot(entry["embedding"], embedding))
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None or best_score < self.similarity_threshold:
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            entry["hits"] += 1
+            self._stats["hits"] += 1
+            return {**entry["payload"], "similarity": best_score}
+
+    def store(self, group_key: Tuple, embedding: np.ndarray, generations: Dict[int, int],
+              payload: Dict[str, Any]):
+        """缓存一条回答，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._entries[entry_id] = {
+                "group_key": group_key,
+                "embedding": embedding,
+                "generations": dict(generations),
+                "payload": payload,
+                "created_at": time.time(),
+                "hits": 0
+            }
+            self._groups.setdefault(group_key, []).append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self._stats["evictions"] += 1
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self._stats["lookups"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0
+            }
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if not entry:
+            return
+        group = self._groups.get(entry["group_key"], [])
+        if entry_id in group:
+            group.remove(entry_id)
+        if not group:
+            self._groups.pop(entry["group_key"], None)
+
+
+# 全局RAG回答缓存实例
+rag_answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.rag_cache_similarity_threshold,
+    ttl_seconds=settings.rag_cache_ttl_seconds,
+    max_entries=settings.rag_cache_max_entries
+)
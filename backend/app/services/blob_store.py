@@ -0,0 +1,60 @@
+import os
+import zlib
+import hashlib
+import tempfile
+from typing import Optional
+from ..core.config import settings
+
+
+class TextBlobStore:
+    """按内容寻址、zlib压缩的文本存储（存放文档提取出的全文）"""
+    def __init__(self, base_dir: Optional[str] = None, compression_level: int = 6):
+        self.base_dir = base_dir or os.path.join(settings.upload_dir, "text_blobs")
+        self.compression_level = compression_level
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def _blob_path(self, key: str) -> str:
+        """blob文件路径，按哈希前两位分目录"""
+        return os.path.join(self.base_dir, key[:2], f"{key}.z")
+
+    def put(self, text: str) -> str:
+        """保存文本并返回其内容哈希；相同内容只存一份"""
+        data = text.encode("utf-8")
+        key = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(key)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，避免并发写入时读到半个文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(zlib.compress(data, self.compression_level))
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return key
+
+    def get(self, key: str) -> Optional[str]:
+        """读取文本，不存在时返回None"""
+        path = self._blob_path(key)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def delete(self, key: str) -> bool:
+        """删除文本"""
+        path = self._blob_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+
+# 全局文本存储实例
+text_blob_store = TextBlobStore()
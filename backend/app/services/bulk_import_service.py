@@ -0,0 +1,275 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+import tarfile
+import zipfile
+from typing import List, Dict, Any, Iterator, Tuple, IO, Callable
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.schemas import DocumentUploadRequest
+from ..services.rag_service import RAGService, SUPPORTED_DOCUMENT_TYPES
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 导入结果状态
+STATUS_IMPORTED = "imported"
+STATUS_DEDUPLICATED = "deduplicated"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+# 生产者等待队列空位时，每隔多少秒检查一次停止信号
+PRODUCER_PUT_TIMEOUT = 1.0
+
+
+class FileTooLargeError(Exception):
+    """单个文件超过大小限制"""
+
+
+class BulkImportService:
+    """批量导入服务：把压缩包或服务器目录中的文档以有限并发送入知识库"""
+    def __init__(self):
+        self.documents_dir = os.path.join(settings.upload_dir, "documents")
+        os.makedirs(self.documents_dir, exist_ok=True)
+
+    async def import_archive(self, archive_path: str, knowledge_base_id: int,
+                             chunk_size: int = 1000, chunk_overlap: int = 200) -> Dict[str, Any]:
+        """导入zip或tar压缩包中的全部文档"""
+        if zipfile.is_zipfile(archive_path):
+            members = self._iter_zip_members
+        elif tarfile.is_tarfile(archive_path):
+            members = self._iter_tar_members
+        else:
+            raise ValueError("Unsupported archive format, expected zip or tar")
+
+        return await self._run(lambda: members(archive_path), knowledge_base_id, chunk_size, chunk_overlap)
+
+    async def import_directory(self, directory: str, knowledge_base_id: int,
+                               chunk_size: int = 1000, chunk_overlap: int = 200) -> Dict[str, Any]:
+        """导入服务器目录中的全部文档（仅限配置允许的目录）"""
+        directory = os.path.realpath(directory)
+        allowed_roots = [os.path.realpath(root) for root in settings.bulk_import_allowed_dirs]
+        if not any(os.path.commonpath([directory, root]) == root for root in allowed_roots):
+            raise PermissionError(f"Directory import not allowed for {directory}")
+        if not os.path.isdir(directory):
+            raise ValueError(f"Directory not found: {directory}")
+
+        return await self._run(lambda: self._iter_directory_files(directory),
+                               knowledge_base_id, chunk_size, chunk_overlap)
+
+    async def _run(self, members: Callable[[], Iterator[Tuple[str, int, Callable[[], IO[bytes]]]]],
+                   knowledge_base_id: int, chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+        """生产者在线程中逐个解出文件，消费者以有限并发执行入库流程"""
+        start_time = time.time()
+        concurrency = max(1, settings.bulk_import_concurrency)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        results: List[Dict[str, Any]] = []
+        loop = asyncio.get_running_loop()
+
+        # 消费者结束（异常或请求被取消）后通知生产者停止，避免其永远阻塞在满队列上
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            """从生产者线程放入队列；停止信号出现或事件循环已关闭时放弃并返回False"""
+            if stop.is_set():
+                return False
+            try:
+                future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            except RuntimeError:
+                return False
+            while True:
+                try:
+                    future.result(timeout=PRODUCER_PUT_TIMEOUT)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+                except concurrent.futures.CancelledError:
+                    return False
+
+        def produce():
+            try:
+                for name, size, open_member in members():
+                    if stop.is_set():
+                        break
+                    item = self._stage_member(name, size, open_member)
+                    if item.get("status"):
+                        results.append(item)
+                        continue
+                    # 队列满时阻塞生产者，限制磁盘上待处理文件的数量
+                    if not put(item):
+                        self._discard_staged(item)
+                        break
+            finally:
+                for _ in range(concurrency):
+                    if not put(None):
+                        break
+
+        # 本次导入中各内容哈希第一个文件的入库完成信号
+        first_ingests: Dict[str, asyncio.Future] = {}
+
+        async def consume():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                first = first_ingests.get(item["content_hash"])
+                if first is None:
+                    first_ingests[item["content_hash"]] = first = loop.create_future()
+                    try:
+                        results.append(await self._ingest(item, knowledge_base_id, chunk_size, chunk_overlap))
+                    finally:
+                        first.set_result(None)
+                    continue
+                # 压缩包内内容相同的文件等第一个入库完成后再处理，走去重路径而不是重复解析和生成embedding
+                await first
+                results.append(await self._ingest(item, knowledge_base_id, chunk_size, chunk_overlap))
+
+        producer = asyncio.create_task(asyncio.to_thread(produce))
+        consumers = [asyncio.create_task(consume()) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*consumers)
+            await producer
+        finally:
+            stop.set()
+            for consumer in consumers:
+                consumer.cancel()
+            await asyncio.gather(producer, *consumers, return_exceptions=True)
+            # 清理已落盘但没有消费者处理的文件
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is not None:
+                    self._discard_staged(item)
+
+        summary = {status: 0 for status in (STATUS_IMPORTED, STATUS_DEDUPLICATED, STATUS_SKIPPED, STATUS_FAILED)}
+        for result in results:
+            summary[result["status"]] += 1
+
+        return {
+            "knowledge_base_id": knowledge_base_id,
+            "total_files": len(results),
+            "summary": summary,
+            "chunk_count": sum(result.get("chunk_count") or 0 for result in results),
+            "processing_time": time.time() - start_time,
+            "files": results
+        }
+
+    def _stage_member(self, name: str, size: int, open_member: Callable[[], IO[bytes]]) -> Dict[str, Any]:
+        """把一个成员复制到文档目录并计算哈希；不支持或过大的文件直接返回跳过结果"""
+        original_name = os.path.basename(name)
+        file_type = original_name.split('.')[-1].lower() if '.' in original_name else ''
+
+        if file_type not in SUPPORTED_DOCUMENT_TYPES:
+            return {"filename": name, "status": STATUS_SKIPPED, "reason": f"Unsupported file type: {file_type or 'none'}"}
+        if size > settings.max_file_size:
+            return {"filename": name, "status": STATUS_SKIPPED, "reason": "File too large"}
+
+        file_path = os.path.join(self.documents_dir, f"{uuid.uuid4()}.{file_type}")
+        try:
+            with open_member() as source, open(file_path, 'wb') as target:
+                content_hash = self._copy_with_hash(source, target)
+        except FileTooLargeError:
+            os.remove(file_path)
+            return {"filename": name, "status": STATUS_SKIPPED, "reason": "File too large"}
+        except Exception as e:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return {"filename": name, "status": STATUS_FAILED, "error": str(e)}
+
+        return {
+            "filename": name,
+            "original_name": original_name,
+            "file_type": file_type,
+            "file_path": file_path,
+            "content_hash": content_hash
+        }
+
+    @staticmethod
+    def _discard_staged(item: Dict[str, Any]):
+        """删除未入库的暂存文件"""
+        if os.path.exists(item["file_path"]):
+            os.remove(item["file_path"])
+
+    @staticmethod
+    def _copy_with_hash(source: IO[bytes], target: IO[bytes]) -> str:
+        """分块复制并计算SHA-256，实际大小超过限制时中止（不信任压缩包头中的大小）"""
+        hasher = hashlib.sha256()
+        copied = 0
+        while True:
+            block = source.read(settings.upload_chunk_size)
+            if not block:
+                break
+            copied += len(block)
+            if copied > settings.max_file_size:
+                raise FileTooLargeError()
+            hasher.update(block)
+            target.write(block)
+        return hasher.hexdigest()
+
+    async def _ingest(self, item: Dict[str, Any], knowledge_base_id: int,
+                      chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+        """用独立的数据库会话执行单个文件的入库"""
+        db = SessionLocal()
+        try:
+            rag_service = RAGService(db)
+            upload_request = DocumentUploadRequest(
+                knowledge_base_id=knowledge_base_id,
+                file_path=item["file_path"],
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap
+            )
+            result = await rag_service.upload_document(
+                upload_request, item["file_path"], item["original_name"],
+                item["file_type"], item["content_hash"]
+            )
+
+            return {
+                "filename": item["filename"],
+                "status": STATUS_DEDUPLICATED if result["deduplicated"] else STATUS_IMPORTED,
+                "document_id": result["document_id"],
+                "chunk_count": result["chunk_count"]
+            }
+
+        except Exception as e:
+            logger.error(f"Error importing {item['filename']}: {e}")
+            if os.path.exists(item["file_path"]):
+                os.remove(item["file_path"])
+            return {"filename": item["filename"], "status": STATUS_FAILED, "error": str(e)}
+
+        finally:
+            db.close()
+
+    @staticmethod
+    def _iter_zip_members(archive_path: str) -> Iterator[Tuple[str, int, Callable[[], IO[bytes]]]]:
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                yield info.filename, info.file_size, lambda info=info: archive.open(info)
+
+    @staticmethod
+    def _iter_tar_members(archive_path: str) -> Iterator[Tuple[str, int, Callable[[], IO[bytes]]]]:
+        # 流式读取（r|*），不需要随机访问整个压缩包
+        with tarfile.open(archive_path, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                yield member.name, member.size, lambda member=member: archive.extractfile(member)
+
+    @staticmethod
+    def _iter_directory_files(directory: str) -> Iterator[Tuple[str, int, Callable[[], IO[bytes]]]]:
+        for root, _, filenames in os.walk(directory):
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                if os.path.islink(path) or not os.path.isfile(path):
+                    continue
+                yield os.path.relpath(path, directory), os.path.getsize(path), lambda path=path: open(path, 'rb')
+
+
+# 全局批量导入服务实例
+bulk_import_service = BulkImportService()
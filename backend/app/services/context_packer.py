@@ -0,0 +1,186 @@
+from typing import List, Dict, Any, Optional
+from .text_chunker import TokenTextChunker, text_chunker
+
+# 各模型的上下文窗口（token）
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106-preview": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-vision-preview": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# 上下文最多占用的token数（即使模型窗口更大，也不必塞满）
+MAX_CONTEXT_TOKENS = 6000
+
+# 增强聊天中记忆上下文最多占用的预算比例（其余留给知识库检索结果）
+MEMORY_BUDGET_RATIO = 0.3
+
+# 提示模板、系统消息等固定开销的预留
+PROMPT_OVERHEAD_TOKENS = 300
+
+# 判断相邻块重叠时用于定位的前缀长度（字符）
+OVERLAP_PROBE_CHARS = 64
+
+# 认定为重叠的最短长度（字符），更短的重合视为巧合
+MIN_OVERLAP_CHARS = 8
+
+
+class ContextPacker:
+    """按token预算打包检索上下文：去重、合并相邻块、按分数贪心装填"""
+    def __init__(self, chunker: Optional[TokenTextChunker] = None):
+        self.chunker = chunker or text_chunker
+
+    def budget_for_model(self, model: str, completion_tokens: int = 2048,
+                         prompt_tokens: int = 0) -> int:
+        """计算某个模型可用于上下文的token预算"""
+        window = MODEL_CONTEXT_WINDOWS.get(model)
+        if window is None:
+            # 带日期后缀的模型名按前缀匹配，如 gpt-4-0613
+            matches = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+            window = MODEL_CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+        budget = window - completion_tokens - prompt_tokens - PROMPT_OVERHEAD_TOKENS
+        return max(0, min(budget, MAX_CONTEXT_TOKENS))
+
+    def pack(self, items: List[Dict[str, Any]], budget: int) -> Dict[str, Any]:
+        """
+        打包上下文条目
+
+        每个条目至少包含 content 和 score，可选 document_id / chunk_index 用于合并相邻块。
+        先去重，再按分数从高到低逐个尝试装入：每次把已装入的条目连同候选一起合并相邻块后计算token数，
+        放得下才装入。因此合并后的整体放不下时，分数更高的那一半仍可以单独装入。
+        返回 {"items", "tokens_used", "tokens_original", "tokens_saved", "tokens_dropped", "dropped"}，
+        其中tokens_saved只统计去重和去掉块间重叠节省的token，因预算不足未装入的计入tokens_dropped。
+        """
+        token_counts: Dict[str, int] = {}
+
+        def count(content: str) -> int:
+            if content not in token_counts:
+                token_counts[content] = self.chunker.count_tokens(content)
+            return token_counts[content]
+
+        tokens_original = sum(count(item["content"]) for item in items)
+
+        packed: List[Dict[str, Any]] = []
+        merged: List[Dict[str, Any]] = []
+        tokens_used = 0
+        dropped: List[Dict[str, Any]] = []
+        for item in sorted(self._deduplicate(items), key=lambda x: x.get("score") or 0.0, reverse=True):
+            trial = self._merge_adjacent(packed + [item])
+            trial_tokens = sum(count(entry["content"]) for entry in trial)
+            if trial_tokens > budget:
+                # 放不下的跳过，继续尝试更短的条目
+                dropped.append(item)
+                continue
+            packed.append(item)
+            merged, tokens_used = trial, trial_tokens
+
+        for entry in merged:
+            entry["tokens"] = count(entry["content"])
+        tokens_dropped = sum(count(item["content"]) for item in dropped)
+
+        return {
+            "items": sorted(merged, key=lambda x: x.get("score") or 0.0, reverse=True),
+            "tokens_used": tokens_used,
+            "tokens_original": tokens_original,
+            "tokens_saved": max(0, tokens_original - tokens_used - tokens_dropped),
+            "tokens_dropped": tokens_dropped,
+            "dropped": len(dropped)
+        }
+
+    def _deduplicate(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去除内容重复或被其他条目完整包含的条目，保留分数更高者"""
+        ordered = sorted(
+            (dict(item) for item in items if item.get("content", "").strip()),
+            key=lambda x: (x.get("score") or 0.0, len(x["content"])),
+            reverse=True
+        )
+
+        kept: List[Dict[str, Any]] = []
+        for item in ordered:
+            normalized = " ".join(item["content"].split())
+            if any(normalized in other["_normalized"] for other in kept):
+                continue
+            item["_normalized"] = normalized
+            kept.append(item)
+
+        for item in kept:
+            del item["_normalized"]
+        return kept
+
+    def _merge_adjacent(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """合并同一文档中 chunk_index 相邻的块，并去掉它们之间的重叠部分"""
+        groups: Dict[Any, List[Dict[str, Any]]] = {}
+        merged: List[Dict[str, Any]] = []
+        for item in items:
+            if item.get("document_id") is None or item.get("chunk_index") is None:
+                merged.append(item)
+            else:
+                groups.setdefault(item["document_id"], []).append(item)
+
+        for group in groups.values():
+            group.sort(key=lambda x: x["chunk_index"])
+            current = group[0]
+            for item in group[1:]:
+                if item["chunk_index"] == current.get("last_chunk_index", current["chunk_index"]) + 1:
+                    current = self._join(current, item)
+                else:
+                    merged.append(current)
+                    current = item
+            merged.append(current)
+
+        return merged
+
+    def join_chunks(self, contents: List[str]) -> str:
+        """按顺序拼接同一文档的连续块，去掉块之间的重叠部分"""
+        joined = ""
+        for content in contents:
+            joined = self._join_text(joined, content) if joined else content
+        return joined
+
+    def _join_text(self, first: str, second: str) -> str:
+        overlap = self._overlap_length(first, second)
+        if overlap:
+            return first + second[overlap:]
+        return first + "\n" + second
+
+    def _join(self, first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+        """拼接两个相邻块"""
+        joined = dict(first)
+        joined["content"] = self._join_text(first["content"], second["content"])
+        joined["score"] = max(first.get("score") or 0.0, second.get("score") or 0.0)
+        joined["last_chunk_index"] = second.get("last_chunk_index", second["chunk_index"])
+        joined["merged_count"] = first.get("merged_count", 1) + second.get("merged_count", 1)
+        return joined
+
+    @staticmethod
+    def _overlap_length(first: str, second: str) -> int:
+        """first 的后缀与 second 的前缀重合的最大长度"""
+        probe = second[:OVERLAP_PROBE_CHARS]
+        if len(probe) < MIN_OVERLAP_CHARS:
+            return 0
+
+        # 重叠部分不短于探针时，用探针定位候选起点
+        position = first.find(probe, max(0, len(first) - len(second)))
+        while position != -1:
+            suffix = first[position:]
+            if second.startswith(suffix):
+                return len(suffix)
+            position = first.find(probe, position + 1)
+
+        # 更短的重叠直接逐个长度比较
+        for length in range(min(len(first), len(probe) - 1), MIN_OVERLAP_CHARS - 1, -1):
+            if first.endswith(second[:length]):
+                return length
+        return 0
+
+
+# 全局上下文打包器实例
+context_packer = ContextPacker()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from typing import List, Dict, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from ..models.models import Message, ConversationSummary
+from ..core.database import SessionLocal
+from ..core.config import settings
+from .llm_service import llm_service
+from .llm_usage import usage_context
+from .text_chunker import text_chunker
+
+logger = logging.getLogger(__name__)
+
+# 每条消息除内容外的格式开销（role等），按token估算
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an AI assistant.
+
+Current summary:
+{previous}
+
+New messages to fold into the summary:
+{transcript}
+
+Write the updated summary in at most {max_words} words. Keep facts, user preferences, decisions,
+open questions and anything the assistant promised to do. Drop greetings and small talk.
+Reply with the summary only."""
+
+
+class ConversationContextManager:
+    """
+    对话上下文窗口管理
+
+    最近的若干轮在token预算内原样发送，更早的消息由后台任务增量并入存储的摘要，
+    每轮提示的长度因此大致恒定，不随对话变长而增长。
+    """
+    def __init__(self):
+        self._summarizing: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _message_tokens(message: Message) -> int:
+        return text_chunker.count_tokens(message.content or "") + MESSAGE_OVERHEAD_TOKENS
+
+    def _split_recent(self, messages: List[Message], max_messages: int,
+                      max_tokens: int) -> Tuple[List[Message], List[Message]]:
+        """
+        从最新的消息往前取，直到达到条数或token上限，返回 (更早的消息, 最近的消息)
+
+        最新的一条消息总是保留。
+        """
+        start = len(messages)
+        tokens = 0
+        while start > 0:
+            cost = self._message_tokens(messages[start - 1])
+            if start < len(messages) and (len(messages) - start >= max_messages or tokens + cost > max_tokens):
+                break
+            tokens += cost
+            start -= 1
+        return messages[:start], messages[start:]
+
+    @staticmethod
+    def _load(db: Session, conversation_id: int) -> Tuple[Optional[ConversationSummary], List[Message]]:
+        """读取摘要和尚未并入摘要的消息"""
+        summary = db.query(ConversationSummary).filter(
+            ConversationSummary.conversation_id == conversation_id
+        ).first()
+        summarized_until = summary.summarized_until_message_id if summary else 0
+        messages = db.query(Message).filter(
+            Message.conversation_id == conversation_id,
+            Message.id > (summarized_until or 0)
+        ).order_by(Message.id.asc()).all()
+        return summary, messages
+
+    def build_messages(self, db: Session, conversation_id: int) -> List[Dict[str, str]]:
+        """
+        构建发送给模型的消息历史：摘要（如有）+ 窗口内的最近消息
+
+        有消息超出窗口时安排后台更新摘要；更新完成前这些消息暂不发送，提示长度保持在预算内。
+        """
+        summary, messages = self._load(db, conversation_id)
+        older, recent = self._split_recent(
+            messages, settings.context_recent_turns * 2, settings.context_recent_max_tokens
+        )
+        if older:
+            self.schedule_summary_update(conversation_id)
+
+        history: List[Dict[str, str]] = []
+        if summary and summary.summary:
+            history.append({
+                "role": "system",
+                "content": f"Summary of the earlier part of this conversation:\n{summary.summary}"
+            })
+        history.extend({"role": message.role, "content": message.content} for message in recent)
+        return history
+
+    def schedule_summary_update(self, conversation_id: int):
+        """
+        在后台把超出窗口的消息并入摘要，同一对话同时只有一个更新任务
+        """
+        if conversation_id in self._summarizing:
+            return
+        self._summarizing.add(conversation_id)
+        task = asyncio.create_task(self._update_summary(conversation_id))
+        # 保留任务引用，避免未完成的任务被回收
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update_summary(self, conversation_id: int):
+        db = SessionLocal()
+        has_more = False
+        try:
+            summary, messages = self._load(db, conversation_id)
+            # 折叠到窗口的一半，之后的若干轮内无需再次摘要
+            older, _ = self._split_recent(
+                messages, settings.context_recent_turns, settings.context_recent_max_tokens // 2
+            )
+            if not older:
+                return
+
+            # 单次并入的消息有token上限，剩余部分由下一次更新处理
+            batch: List[Message] = []
+            tokens = 0
+            for message in older:
+                cost = self._message_tokens(message)
+                if batch and tokens + cost > settings.context_summary_input_max_tokens:
+                    break
+                batch.append(message)
+                tokens += cost
+
+            text = await self._summarize(conversation_id, summary.summary if summary else "", batch)
+
+            if summary is None:
+                summary = ConversationSummary(conversation_id=conversation_id, summarized_message_count=0)
+                db.add(summary)
+            summary.summary = text
+            summary.summarized_until_message_id = batch[-1].id
+            summary.summarized_message_count = (summary.summarized_message_count or 0) + len(batch)
+            db.commit()
+            has_more = len(batch) < len(older)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating summary for conversation {conversation_id}: {e}")
+        finally:
+            db.close()
+            self._summarizing.discard(conversation_id)
+
+        if has_more:
+            self.schedule_summary_update(conversation_id)
+
+    async def _summarize(self, conversation_id: int, previous: str, messages: List[Message]) -> str:
+        """调用LLM把新消息并入已有摘要"""
+        limit = settings.context_summary_input_max_tokens
+        lines = []
+        for message in messages:
+            content = message.content or ""
+            if text_chunker.count_tokens(content) > limit:
+                content = text_chunker.split_text(content, chunk_size=limit, chunk_overlap=0)[0]
+            lines.append(f"{message.role}: {content}")
+
+        prompt = SUMMARY_PROMPT.format(
+            previous=previous or "(empty)",
+            transcript="\n".join(lines),
+            max_words=int(settings.context_summary_max_tokens * 0.6)
+        )
+        with usage_context(caller="conversation.summary", conversation_id=conversation_id):
+            response = await llm_service.chat_completion(
+                [{"role": "user", "content": prompt}],
+                model=settings.context_summary_model,
+                max_tokens=settings.context_summary_max_tokens,
+                temperature=0,
+                priority="background"
+            )
+        return response["content"].strip()
+
+    def delete_summary(self, db: Session, conversation_id: int):
+        """删除对话的摘要（调用方提交事务）"""
+        db.query(ConversationSummary).filter(
+            ConversationSummary.conversation_id == conversation_id
+        ).delete()
+
+
+# 全局对话上下文管理实例
+conversation_context_manager = ConversationContextManager()
@@ -3,6 +3,8 @@ from typing import List, Optional
 from ..models.models import Conversation, Message, User
 from ..models.schemas import ConversationCreate, MessageCreate, ChatRequest, ChatResponse
 from ..services.llm_service import llm_service
+from ..services.llm_usage import usage_context
+from ..services.conversation_context import conversation_context_manager
 from datetime import datetime
 import uuid
 
@@ -92,31 +94,31 @@ class ConversationService:
             media_url=chat_request.media_url
         ))
 
-        # 构建消息历史
-        messages = self.get_conversation_messages(chat_request.conversation_id)
-        message_history = [{"role": msg.role, "content": msg.content} for msg in messages]
-
-        # 处理多模态消息
-        if chat_request.message_type == "image" and chat_request.media_url:
-            # 图像分析
-            analysis_result = await llm_service.analyze_image(
-                chat_request.media_url,
-                "Analyze this image and respond to the user's question: " + chat_request.message
-            )
-            response_content = analysis_result["analysis"]
-        elif chat_request.message_type == "audio" and chat_request.media_url:
-            # 音频转录
-            transcription_result = await llm_service.transcribe_audio(chat_request.media_url)
-            response_content = f"Transcribed: {transcription_result['text']}"
-        else:
-            # 文本对话
-            llm_response = await llm_service.chat_completion(
-                messages=message_history,
-                model=chat_request.model,
-                max_tokens=chat_request.max_tokens,
-                temperature=chat_request.temperature
-            )
-            response_content = llm_response["content"]
+        # 构建消息历史（滚动摘要 + 最近的消息）
+        message_history = conversation_context_manager.build_messages(self.db, chat_request.conversation_id)
+
+        # 处理多模态消息（用量归到该对话）
+        with usage_context(caller="chat", conversation_id=chat_request.conversation_id):
+            if chat_request.message_type == "image" and chat_request.media_url:
+                # 图像分析
+                analysis_result = await llm_service.analyze_image(
+                    chat_request.media_url,
+                    "Analyze this image and respond to the user's question: " + chat_request.message
+                )
+                response_content = analysis_result["analysis"]
+            elif chat_request.message_type == "audio" and chat_request.media_url:
+                # 音频转录
+                transcription_result = await llm_service.transcribe_audio(chat_request.media_url)
+                response_content = f"Transcribed: {transcription_result['text']}"
+            else:
+                # 文本对话
+                llm_response = await llm_service.chat_completion(
+                    messages=message_history,
+                    model=chat_request.model,
+                    max_tokens=chat_request.max_tokens,
+                    temperature=chat_request.temperature
+                )
+                response_content = llm_response["content"]
 
         # 添加AI回复消息
         ai_message = self.add_message(MessageCreate(
@@ -140,8 +142,9 @@ class ConversationService:
         """
         conversation = self.get_conversation(conversation_id)
         if conversation:
-            # 删除相关消息
+            # 删除相关消息和摘要
             self.db.query(Message).filter(Message.conversation_id == conversation_id).delete()
+            conversation_context_manager.delete_summary(self.db, conversation_id)
             self.db.delete(conversation)
             self.db.commit()
             return True
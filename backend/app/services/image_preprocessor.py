@@ -0,0 +1,129 @@
+import io
+import os
+import base64
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+from PIL import Image, ImageOps
+from ..core.config import settings
+from .parse_cache import CompressedDiskCache
+from .single_flight import SingleFlight
+
+# 预处理逻辑变化时递增，使旧的缓存条目失效
+PREPROCESSOR_VERSION = 1
+
+# 模型处理图像时的有效分辨率（与detail对应），超出部分只会增加传输和处理开销
+DETAIL_LIMITS = {
+    "high": (2048, 768),  # 先缩放到2048以内，再把短边缩放到768
+    "low": (512, 512),
+}
+
+# 直接转发、不做预处理的URL前缀
+REMOTE_URL_PREFIXES = ("http://", "https://", "data:")
+
+
+class ImagePreprocessor:
+    """
+    图像分析前的预处理
+
+    本地图像（上传目录内的文件）缩放到模型的有效分辨率，重新编码为JPEG并转成base64 data URL，
+    结果按文件内容哈希缓存在独立的image命名空间中；远程URL和data URL原样转发。
+    """
+    def __init__(self, cache: Optional[CompressedDiskCache] = None):
+        self.cache = cache or CompressedDiskCache(
+            cache_dir=os.path.join(settings.upload_dir, "image_cache"),
+            max_bytes=settings.image_cache_max_bytes,
+            namespace="image"
+        )
+        self._flight = SingleFlight()
+        self._stats = {"prepared": 0, "cache_hits": 0, "passthrough": 0,
+                       "original_bytes": 0, "encoded_bytes": 0}
+
+    def _local_path(self, image_url: str) -> Optional[str]:
+        """只处理上传目录内的本地文件，其他路径不读取"""
+        if image_url.startswith(REMOTE_URL_PREFIXES):
+            return None
+        path = image_url[len("file://"):] if image_url.startswith("file://") else image_url
+        path = os.path.realpath(path)
+        upload_root = os.path.realpath(settings.upload_dir)
+        if os.path.commonpath([path, upload_root]) != upload_root or not os.path.isfile(path):
+            return None
+        return path
+
+    async def prepare(self, image_url: str, detail: str = "high") -> Dict[str, Any]:
+        """
+        返回 {"url": 发送给模型的URL, "content_hash": 本地文件的内容哈希, "cached": 是否命中缓存}
+        """
+        path = self._local_path(image_url)
+        if path is None:
+            self._stats["passthrough"] += 1
+            return {"url": image_url, "content_hash": None, "cached": False}
+
+        data = await asyncio.to_thread(self._read, path)
+        content_hash = hashlib.sha256(data).hexdigest()
+        max_side, short_side = DETAIL_LIMITS.get(detail, DETAIL_LIMITS["high"])
+        key = f"{content_hash}:{max_side}x{short_side}:q{settings.image_jpeg_quality}:v{PREPROCESSOR_VERSION}"
+
+        cached_url = await asyncio.to_thread(self.cache.get, key)
+        if cached_url is not None:
+            self._stats["cache_hits"] += 1
+            return {"url": cached_url, "content_hash": content_hash, "cached": True}
+
+        async def encode():
+            url = await asyncio.to_thread(self._encode, data, max_side, short_side)
+            await asyncio.to_thread(self.cache.put, key, url)
+            self._stats["prepared"] += 1
+            self._stats["original_bytes"] += len(data)
+            self._stats["encoded_bytes"] += len(url)
+            return url
+
+        url = await self._flight.do(key, encode)
+        return {"url": url, "content_hash": content_hash, "cached": False}
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _target_size(width: int, height: int, max_side: int, short_side: int) -> Tuple[int, int]:
+        """先让长边不超过max_side，再让短边不超过short_side，只缩小不放大"""
+        scale = min(1.0, max_side / max(width, height))
+        short = min(width, height) * scale
+        if short > short_side:
+            scale *= short_side / short
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def _encode(self, data: bytes, max_side: int, short_side: int) -> str:
+        """缩放并编码为data URL；原图已足够小且更省字节时保留原始编码"""
+        image = Image.open(io.BytesIO(data))
+        original_format = image.format
+        image = ImageOps.exif_transpose(image)
+        target = self._target_size(image.width, image.height, max_side, short_side)
+        resized = target != (image.width, image.height)
+        if resized:
+            image = image.resize(target, Image.LANCZOS)
+
+        # JPEG不支持透明通道，透明部分铺白底
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=settings.image_jpeg_quality, optimize=True)
+        encoded, mime = buffer.getvalue(), "image/jpeg"
+
+        if not resized and original_format in ("JPEG", "PNG", "WEBP", "GIF") and len(data) <= len(encoded):
+            encoded, mime = data, Image.MIME[original_format]
+
+        return f"data:{mime};base64,{base64.b64encode(encoded).decode('ascii')}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "single_flight": self._flight.get_stats()}
+
+
+# 全局图像预处理实例
+image_preprocessor = ImagePreprocessor()
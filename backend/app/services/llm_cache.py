@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from ..core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 磁盘缓存超出容量时淘汰到上限的这个比例，之后的多次写入都不需要再统计条目数
+EVICTION_LOW_WATER_RATIO = 0.9
+
+
+class MemoryCacheBackend:
+    """进程内LRU缓存后端"""
+    blocking = False
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (值, 过期时间)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> int:
+        """写入条目，返回因容量淘汰的条目数"""
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl_seconds)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[str, str], ttl_seconds: int) -> int:
+        return sum(self.set(key, value, ttl_seconds) for key, value in items.items())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """基于SQLite的磁盘缓存后端，进程重启后仍然有效"""
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 5000, table: str = "llm_cache"):
+        self.path = path
+        self.max_entries = max_entries
+        self.table = table
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_accessed_at ON {table} (accessed_at)")
+        self._conn.commit()
+
+        # 条目数的上界估计：写入时累加（覆盖已有键也会计入），超出容量时才精确统计并淘汰
+        self._estimated_entries = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl_seconds, now)
+            )
+            self._estimated_entries += 1
+            overflow = self._evict(now) if self._estimated_entries > self.max_entries else 0
+            self._conn.commit()
+            return overflow
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        now = time.time()
+        found: Dict[str, str] = {}
+        with self._lock:
+            # SQLite单条语句的参数个数有限，分批查询
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) AND expires_at >= ?",
+                    (*batch, now)
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def set_many(self, items: Dict[str, str], ttl_seconds: int) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now + ttl_seconds, now) for key, value in items.items()]
+            )
+            self._estimated_entries += len(items)
+            overflow = self._evict(now) if self._estimated_entries > self.max_entries else 0
+            self._conn.commit()
+            return overflow
+
+    def _evict(self, now: float) -> int:
+        """
+        先清理过期条目，仍超出容量时按最近访问时间淘汰到低水位，返回容量淘汰数（调用方持有锁）
+
+        只在条目数估计值超出容量时调用，淘汰到低水位后要再写入一批新键才会再次触发。
+        """
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        overflow = 0
+        if entries > self.max_entries:
+            overflow = entries - int(self.max_entries * EVICTION_LOW_WATER_RATIO)
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)", (overflow,)
+            )
+        self._estimated_entries = entries - overflow
+        return overflow
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+            self._estimated_entries = 0
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class LLMResponseCache:
+    """
+    确定性LLM请求的响应缓存
+
+    缓存键为请求参数（消息、模型、温度等）规范化JSON的SHA-256，
+    值为chat_completion返回的结果字典。
+    """
+    def __init__(self, backend, ttl_seconds: int = 86400):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(**request) -> str:
+        """请求参数的规范化哈希，字典键顺序不影响结果"""
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的结果，未命中返回None"""
+        self._stats["lookups"] += 1
+        try:
+            value = await self._call(self.backend.get, key)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Error reading LLM cache: {e}")
+            value = None
+
+        if value is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["hits"] += 1
+        return json.loads(value)
+
+    async def set(self, key: str, result: Dict[str, Any]):
+        """缓存一条结果"""
+        try:
+            value = json.dumps(result, ensure_ascii=False)
+            self._stats["evictions"] += await self._call(self.backend.set, key, value, self.ttl_seconds)
+            self._stats["stores"] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Error writing LLM cache: {e}")
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量读取，返回命中的 {key: 结果}"""
+        self._stats["lookups"] += len(keys)
+        try:
+            values = await self._call(self.backend.get_many, keys)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Error reading LLM cache: {e}")
+            values = {}
+
+        self._stats["hits"] += len(values)
+        self._stats["misses"] += len(keys) - len(values)
+        return {key: json.loads(value) for key, value in values.items()}
+
+    async def set_many(self, items: Dict[str, Any]):
+        """批量写入"""
+        if not items:
+            return
+        try:
+            values = {key: json.dumps(result, ensure_ascii=False) for key, result in items.items()}
+            self._stats["evictions"] += await self._call(self.backend.set_many, values, self.ttl_seconds)
+            self._stats["stores"] += len(values)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Error writing LLM cache: {e}")
+
+    async def clear(self):
+        await self._call(self.backend.clear)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        lookups = self._stats["lookups"]
+        return {
+            **self._stats,
+            "backend": type(self.backend).__name__,
+            "entries": await self._call(self.backend.size),
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0
+        }
+
+    async def _call(self, func, *args):
+        # 磁盘后端在线程中执行，不阻塞事件循环
+        if self.backend.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+
+def create_llm_response_cache(table: str = "llm_cache", max_entries: Optional[int] = None,
+                              ttl_seconds: Optional[int] = None) -> LLMResponseCache:
+    """根据配置创建缓存实例；sqlite后端中不同用途的缓存使用不同的表"""
+    max_entries = max_entries or settings.llm_cache_max_entries
+    if settings.llm_cache_backend == "sqlite":
+        backend = SQLiteCacheBackend(settings.llm_cache_path, max_entries, table)
+    else:
+        backend = MemoryCacheBackend(max_entries)
+    return LLMResponseCache(backend, ttl_seconds or settings.llm_cache_ttl_seconds)
+
+
+# 全局LLM响应缓存实例
+llm_response_cache = create_llm_response_cache()
+
+# 全局远程embedding缓存实例（按模型 + 文本内容哈希）
+embedding_cache = create_llm_response_cache(
+    "embedding_cache", settings.embedding_cache_max_entries, settings.embedding_cache_ttl_seconds
+)
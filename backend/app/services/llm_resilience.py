@@ -0,0 +1,244 @@
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+import openai
+from ..core.config import settings
+
+# 计算p95延迟所需的最少样本数，样本不足时不发起对冲请求
+MIN_HEDGE_SAMPLES = 20
+
+# 每个模型保留的最近延迟样本数
+LATENCY_SAMPLE_SIZE = 200
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """模型熔断中，请求被直接拒绝"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """判断上游错误是否值得重试（超时、连接错误、限流、服务端错误）"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """读取响应中的Retry-After头"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    单个模型的熔断器
+
+    连续失败达到阈值后打开，冷却期内直接拒绝请求；冷却结束后放行一个探测请求，
+    成功则关闭，失败则重新打开。
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """是否允许发起请求"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """探测请求没有记录结果就结束时（如被取消）释放探测名额，下一个请求可以重新探测"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.open_count += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "open_count": self.open_count
+        }
+
+
+class LLMResilience:
+    """上游调用的重试、对冲请求与熔断降级"""
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._stats = {"calls": 0, "retries": 0, "hedges_fired": 0, "hedges_won": 0,
+                       "fallbacks": 0, "rejected": 0, "failures": 0}
+
+    def breaker_for(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(settings.llm_circuit_failure_threshold, settings.llm_circuit_reset_seconds)
+            self._breakers[model] = breaker
+        return breaker
+
+    def p95_latency(self, model: str) -> Optional[float]:
+        """最近请求的p95延迟，样本不足时返回None"""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    async def call(self, model: str, func: Callable[[str], Awaitable[Any]], hedge: bool = False,
+                   fallback: bool = True) -> Any:
+        """
+        以重试、熔断和降级执行 func(model)
+
+        主模型重试耗尽或熔断时改用配置的备用模型（fallback为False时不降级）；
+        hedge为True时对幂等请求启用对冲。
+        """
+        self._stats["calls"] += 1
+        models = [model]
+        fallback_model = settings.llm_fallback_models.get(model) if fallback else None
+        if fallback_model and fallback_model != model:
+            models.append(fallback_model)
+
+        last_error: Optional[BaseException] = None
+        for index, candidate in enumerate(models):
+            breaker = self.breaker_for(candidate)
+            if not breaker.allow():
+                self._stats["rejected"] += 1
+                last_error = CircuitOpenError(f"Circuit open for model {candidate}")
+                continue
+            if index > 0:
+                self._stats["fallbacks"] += 1
+
+            probe = breaker.state == CircuitBreaker.HALF_OPEN
+            try:
+                return await self._call_with_retries(candidate, func, hedge, breaker)
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    # 请求本身的错误（参数错误、鉴权失败等）换模型也无济于事
+                    raise
+            finally:
+                # 无论以何种方式退出都要释放探测名额，否则熔断器会永久停在半开状态
+                if probe:
+                    breaker.release_probe()
+
+        self._stats["failures"] += 1
+        raise last_error
+
+    async def _call_with_retries(self, model: str, func: Callable[[str], Awaitable[Any]],
+                                 hedge: bool, breaker: CircuitBreaker) -> Any:
+        attempt = 0
+        while True:
+            started_at = time.monotonic()
+            try:
+                if hedge and settings.llm_hedging_enabled:
+                    result = await self._hedged(model, func)
+                else:
+                    result = await func(model)
+            except Exception as e:
+                if not is_retryable(e):
+                    # 上游正常给出了响应（如400上下文超长），对熔断器而言模型是健康的
+                    if isinstance(e, openai.APIStatusError):
+                        breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt >= settings.llm_max_retries or breaker.state == CircuitBreaker.OPEN:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                attempt += 1
+                self._stats["retries"] += 1
+                continue
+
+            breaker.record_success()
+            self._latencies.setdefault(model, deque(maxlen=LATENCY_SAMPLE_SIZE)).append(
+                time.monotonic() - started_at
+            )
+            return result
+
+    @staticmethod
+    def _backoff(attempt: int, error: BaseException) -> float:
+        """指数退避加全抖动；服务端给出Retry-After时以其为准"""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, settings.llm_retry_max_delay)
+        ceiling = min(settings.llm_retry_max_delay, settings.llm_retry_base_delay * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def _hedged(self, model: str, func: Callable[[str], Awaitable[Any]]) -> Any:
+        """主请求超过p95延迟仍未完成时发出一个副本，取先成功的结果"""
+        delay = self.p95_latency(model)
+        if delay is None:
+            return await func(model)
+
+        primary = asyncio.create_task(func(model))
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            self._stats["hedges_fired"] += 1
+            hedge = asyncio.create_task(func(model))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._stats["hedges_won"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "models": {
+                model: {**breaker.get_stats(), "p95_latency": self.p95_latency(model)}
+                for model, breaker in self._breakers.items()
+            }
+        }
+
+
+# 全局LLM调用容错实例
+llm_resilience = LLMResilience()
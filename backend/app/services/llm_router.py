@@ -0,0 +1,168 @@
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from ..core.config import settings
+from .llm_resilience import llm_resilience, is_retryable, CircuitOpenError, CircuitBreaker
+
+# 路由策略
+POLICY_ORDERED = "ordered"  # 按偏好顺序取第一个健康的模型
+POLICY_FASTEST = "fastest"  # 取p95延迟最低的健康模型
+POLICY_FASTEST_UNDER_SLO = "fastest_under_slo"  # 按偏好顺序取第一个满足SLO的模型，都不满足时取最快的
+ROUTING_POLICIES = {POLICY_ORDERED, POLICY_FASTEST, POLICY_FASTEST_UNDER_SLO}
+
+# 每个模型保留的最多观测样本数
+MAX_HEALTH_SAMPLES = 1000
+
+
+class ModelHealth:
+    """单个模型最近一段时间的延迟和错误率"""
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._samples: deque = deque(maxlen=MAX_HEALTH_SAMPLES)  # (时间, 延迟, 是否成功)
+
+    def observe(self, latency: float, ok: bool):
+        self._samples.append((time.monotonic(), latency, ok))
+
+    def _recent(self) -> List[tuple]:
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """窗口内的样本数、错误率和成功请求的延迟分位数"""
+        samples = self._recent()
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        errors = sum(1 for _, _, ok in samples if not ok)
+
+        def percentile(ratio: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * ratio))]
+
+        return {
+            "samples": len(samples),
+            "errors": errors,
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "p50_latency": percentile(0.5),
+            "p95_latency": percentile(0.95)
+        }
+
+
+class LLMRouter:
+    """
+    按请求类别选择模型
+
+    配置了路由类别（见 llm_routes）的请求，调用方指定的模型与该类别的备用模型一起按策略排序：
+    它健康且满足SLO时仍排在最前，变慢或出错率过高时让位于其他模型；依次尝试直到成功。
+    """
+    def __init__(self):
+        self._health: Dict[str, ModelHealth] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def health_for(self, model: str) -> ModelHealth:
+        health = self._health.get(model)
+        if health is None:
+            health = ModelHealth(settings.llm_router_window_seconds)
+            self._health[model] = health
+        return health
+
+    def observe(self, model: str, latency: float, ok: bool):
+        self.health_for(model).observe(latency, ok)
+
+    def _is_healthy(self, model: str, snapshot: Dict[str, Any]) -> bool:
+        if llm_resilience.breaker_for(model).state == CircuitBreaker.OPEN:
+            return False
+        if snapshot["samples"] < settings.llm_router_min_samples:
+            return True
+        return snapshot["error_rate"] <= settings.llm_router_max_error_rate
+
+    def candidates(self, route: Optional[str], model: str) -> List[str]:
+        """
+        返回按策略排序的候选模型；调用方指定的模型作为偏好列表的第一项参与排序，
+        未配置的路由类别只使用该模型
+        """
+        config = settings.llm_routes.get(route) if route and settings.llm_router_enabled else None
+        if not config:
+            return [model]
+
+        # 调用方指定的模型排在偏好列表最前，同等条件下优先使用
+        preferred: List[str] = [model]
+        for name in config.get("models", []):
+            if name not in preferred:
+                preferred.append(name)
+
+        snapshots = {name: self.health_for(name).snapshot() for name in preferred}
+        healthy = [name for name in preferred if self._is_healthy(name, snapshots[name])]
+        unhealthy = [name for name in preferred if name not in healthy]
+        policy = config.get("policy", POLICY_ORDERED)
+
+        def p95(name: str) -> float:
+            # 样本不足的模型按0处理，使其有机会被探测到
+            value = snapshots[name]["p95_latency"]
+            if value is None or snapshots[name]["samples"] < settings.llm_router_min_samples:
+                return 0.0
+            return value
+
+        if policy == POLICY_FASTEST:
+            healthy.sort(key=p95)
+        elif policy == POLICY_FASTEST_UNDER_SLO:
+            slo = config.get("slo_ms", 0) / 1000.0
+            within = [name for name in healthy if not slo or p95(name) <= slo]
+            healthy = within + sorted((name for name in healthy if name not in within), key=p95)
+
+        # 不健康的模型放在最后兜底，而不是直接丢弃
+        return healthy + unhealthy
+
+    async def call(self, route: Optional[str], model: str, func: Callable[[str], Awaitable[Any]],
+                   hedge: bool = False, fallback: bool = True) -> Any:
+        """
+        依次尝试候选模型执行 func(model)，每个候选内部仍由llm_resilience负责重试和熔断
+
+        只有一个候选时沿用llm_fallback_models中的备用模型。
+        """
+        candidates = self.candidates(route, model) if fallback else [model]
+        stats = self._stats.setdefault(route or "default", {"requests": 0, "fallbacks": 0, "failures": 0,
+                                                            "selected": {}})
+        stats["requests"] += 1
+
+        async def observed(candidate: str):
+            started_at = time.perf_counter()
+            try:
+                result = await func(candidate)
+            except Exception as e:
+                # 请求本身的错误不计入模型健康度
+                if is_retryable(e):
+                    self.observe(candidate, time.perf_counter() - started_at, False)
+                raise
+            self.observe(candidate, time.perf_counter() - started_at, True)
+            return result
+
+        last_error: Optional[BaseException] = None
+        for index, candidate in enumerate(candidates):
+            if index > 0:
+                stats["fallbacks"] += 1
+            try:
+                result = await llm_resilience.call(
+                    candidate, observed, hedge=hedge, fallback=fallback and len(candidates) == 1
+                )
+            except Exception as e:
+                if not is_retryable(e) and not isinstance(e, CircuitOpenError):
+                    raise
+                last_error = e
+                continue
+            stats["selected"][candidate] = stats["selected"].get(candidate, 0) + 1
+            return result
+
+        stats["failures"] += 1
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "routes": self._stats,
+            "models": {model: health.snapshot() for model, health in self._health.items()}
+        }
+
+
+# 全局LLM模型路由实例
+llm_router = LLMRouter()
@@ -0,0 +1,213 @@
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from typing import Dict, Any, List, Optional
+from ..core.config import settings
+
+# 优先级通道，数值越小越先调度
+PRIORITY_LANES = {
+    "interactive": 0,  # 用户正在等待的请求（聊天、RAG回答）
+    "agent": 1,        # 多Agent协作任务
+    "background": 2,   # 记忆提取等后台任务
+}
+DEFAULT_LANE = "interactive"
+
+# 每个通道保留的最近排队时间样本数，用于计算分位数
+WAIT_SAMPLE_SIZE = 1000
+
+
+class LLMQueueTimeoutError(Exception):
+    """请求在队列中等待超时"""
+
+
+class AdmissionSlot:
+    """一次获准的上游调用，结束时必须调用 release()"""
+    def __init__(self, limiter: "ModelLimiter", reserved_tokens: int):
+        self._limiter = limiter
+        self._released = False
+        self.reserved_tokens = reserved_tokens
+
+    def release(self, used_tokens: Optional[int] = None):
+        """释放并发名额；传入实际用量时退还多预留的token"""
+        if self._released:
+            return
+        self._released = True
+        self._limiter._release(self.reserved_tokens, used_tokens)
+
+    async def __aenter__(self) -> "AdmissionSlot":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class ModelLimiter:
+    """
+    单个模型的准入控制
+
+    同时限制并发请求数和每分钟token数（令牌桶）。等待中的请求按优先级通道排序，
+    同一通道内先到先得。
+    """
+    def __init__(self, model: str, max_concurrency: int, tokens_per_minute: int = 0):
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = tokens_per_minute
+
+        self._active = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._waiters: List = []  # (优先级, 序号, future, 预留token数)
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        self._lanes = {
+            lane: {"admitted": 0, "timeouts": 0, "waits": deque(maxlen=WAIT_SAMPLE_SIZE)}
+            for lane in PRIORITY_LANES
+        }
+
+    async def acquire(self, lane: str, tokens: int, timeout: Optional[float] = None) -> AdmissionSlot:
+        """排队等待准入"""
+        lane = lane if lane in PRIORITY_LANES else DEFAULT_LANE
+        if self.tokens_per_minute:
+            # 超过整个预算的请求按预算上限计，避免永远无法准入
+            tokens = min(tokens, self.tokens_per_minute)
+
+        enqueued_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        entry = (PRIORITY_LANES[lane], next(self._sequence), future, tokens)
+        heapq.heappush(self._waiters, entry)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时与准入同时发生，已经占用了名额
+                future.result().release()
+            else:
+                future.cancel()
+                self._remove_waiter(entry)
+            self._lanes[lane]["timeouts"] += 1
+            raise LLMQueueTimeoutError(f"Timed out waiting for {self.model} capacity")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                future.result().release()
+            else:
+                future.cancel()
+                self._remove_waiter(entry)
+            raise
+
+        self._lanes[lane]["admitted"] += 1
+        self._lanes[lane]["waits"].append(time.monotonic() - enqueued_at)
+        return future.result()
+
+    def _remove_waiter(self, entry):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        self._dispatch()
+
+    def _refill(self):
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60.0
+        )
+        self._refilled_at = now
+
+    def _dispatch(self):
+        """按优先级放行等待中的请求，直到并发或token预算用尽"""
+        self._refill()
+        while self._waiters and self._active < self.max_concurrency:
+            _, _, future, tokens = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            if self.tokens_per_minute and self._tokens < tokens:
+                # 队首请求的token不足时整体等待，避免低优先级的小请求插队
+                self._schedule_wakeup((tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+                return
+
+            heapq.heappop(self._waiters)
+            self._active += 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+            future.set_result(AdmissionSlot(self, tokens))
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_later(max(delay, 0.01), self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _release(self, reserved_tokens: int, used_tokens: Optional[int]):
+        self._active -= 1
+        if self.tokens_per_minute and used_tokens is not None:
+            self._refill()
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + reserved_tokens - used_tokens)
+        self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        queued = {lane: 0 for lane in PRIORITY_LANES}
+        lane_names = {priority: lane for lane, priority in PRIORITY_LANES.items()}
+        for priority, _, future, _ in self._waiters:
+            if not future.done():
+                queued[lane_names[priority]] += 1
+
+        self._refill()
+        lanes = {}
+        for lane, stats in self._lanes.items():
+            waits = sorted(stats["waits"])
+            lanes[lane] = {
+                "queued": queued[lane],
+                "admitted": stats["admitted"],
+                "timeouts": stats["timeouts"],
+                "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+                "p95_wait": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                "max_wait": waits[-1] if waits else 0.0
+            }
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "tokens_per_minute": self.tokens_per_minute,
+            "tokens_available": int(self._tokens) if self.tokens_per_minute else None,
+            "lanes": lanes
+        }
+
+
+class LLMScheduler:
+    """上游LLM调用的准入层，每个模型一个限流器"""
+    def __init__(self):
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def limiter_for(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limits = settings.llm_model_limits.get(model, {})
+            limiter = ModelLimiter(
+                model,
+                limits.get("max_concurrency", settings.llm_default_max_concurrency),
+                limits.get("tokens_per_minute", settings.llm_default_tokens_per_minute)
+            )
+            self._limiters[model] = limiter
+        return limiter
+
+    async def acquire(self, model: str, lane: str = DEFAULT_LANE, tokens: int = 0) -> AdmissionSlot:
+        """为一次上游调用排队，返回的slot需在调用结束后释放"""
+        return await self.limiter_for(model).acquire(lane, tokens, settings.llm_queue_timeout_seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {model: limiter.get_stats() for model, limiter in self._limiters.items()}
+
+
+# 全局LLM调度器实例
+llm_scheduler = LLMScheduler()
@@ -1,89 +1,323 @@
 import openai
-from typing import List, Dict, Any, Optional
+import httpx
+import aiofiles
+import os
+import time
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple
 from ..core.config import settings
+from .llm_cache import llm_response_cache, embedding_cache
+from .single_flight import SingleFlight, StreamSingleFlight
+from .llm_scheduler import llm_scheduler, DEFAULT_LANE
+from .llm_resilience import llm_resilience
+from .llm_router import llm_router
+from .llm_usage import llm_usage_tracker
+from .llm_stream import ChatStream
+from .tts_cache import tts_cache
+from .image_preprocessor import image_preprocessor
+from .text_chunker import text_chunker
 import json
 
 class LLMService:
     def __init__(self):
-        self.client = openai.OpenAI(
+        # 所有请求共享一个异步HTTP连接池，并发上限由连接数决定，空闲连接保持keep-alive复用
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=settings.openai_max_keepalive_connections,
+                keepalive_expiry=settings.openai_keepalive_expiry
+            ),
+            timeout=httpx.Timeout(
+                settings.openai_timeout,
+                connect=settings.openai_connect_timeout
+            )
+        )
+        self.client = openai.AsyncOpenAI(
             api_key=settings.openai_api_key,
-            base_url=settings.openai_base_url
+            base_url=settings.openai_base_url,
+            # 重试由llm_resilience统一处理（带抖动退避和熔断），客户端自身不再重试
+            max_retries=0,
+            http_client=self.http_client
         )
 
+        # 合并并发的相同请求
+        self._chat_flight = SingleFlight()
+        self._stream_flight = StreamSingleFlight()
+        self._embedding_flight = SingleFlight()
+        self._tts_flight = SingleFlight()
+
+    async def aclose(self):
+        """
+        关闭连接池（应用关闭时调用）
+        """
+        await self.http_client.aclose()
+
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
         model: str = "gpt-3.5-turbo",
         max_tokens: int = 2048,
         temperature: float = 0.7,
-        stream: bool = False
+        stream: bool = False,
+        cache: Optional[bool] = None,
+        priority: str = DEFAULT_LANE,
+        route: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         进行文本聊天完成
+
+        cache为None时仅对temperature为0的确定性请求使用响应缓存，True/False强制开启/关闭。
+        流式请求不缓存，返回ChatStream，async for 产出规范化的增量事件和带用量、时延的done事件，
+        使用完毕后调用 aclose()。
+        相同的并发请求只向上游发送一次。
+        priority为调度通道：interactive / agent / background。
+        route为路由类别（见 llm_routes），model与该类别的备用模型按延迟、错误率和SLO排序后依次尝试，实际使用的模型见返回的model_used。
         """
+        request = {"messages": messages, "model": model, "max_tokens": max_tokens, "temperature": temperature}
+        if route:
+            request["route"] = route
+        request_key = llm_response_cache.make_key(**request)
+
+        if stream:
+            # 未启用合并时使用唯一键，每个请求独占一个上游流
+            flight_key = request_key if settings.llm_single_flight_enabled else object()
+            return ChatStream(self._stream_flight.subscribe(
+                flight_key, lambda: self._create_chat_stream(messages, model, max_tokens, temperature, priority, route)
+            ))
+
+        use_cache = settings.llm_cache_enabled and (
+            cache if cache is not None else temperature == 0
+        )
+        if use_cache:
+            cached = await llm_response_cache.get(request_key)
+            if cached is not None:
+                llm_usage_tracker.record("chat", model, cached=True)
+                return {**cached, "cached": True}
+
+        async def complete():
+            try:
+                result = await llm_router.call(
+                    route,
+                    model,
+                    lambda candidate: self._create_chat_completion(messages, candidate, max_tokens, temperature, priority),
+                    hedge=True
+                )
+            except Exception as e:
+                raise Exception(f"LLM API error: {str(e)}") from e
+            if use_cache:
+                await llm_response_cache.set(request_key, result)
+            return result
+
+        if settings.llm_single_flight_enabled:
+            return await self._chat_flight.do(request_key, complete)
+        return await complete()
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+        """
+        估算一次请求最多消耗的token数（提示 + 最大生成长度），用于准入预留
+        """
+        prompt_tokens = 0
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                prompt_tokens += text_chunker.count_tokens(content) + 4
+        return prompt_tokens + max_tokens
+
+    async def _create_chat_stream(self, messages: List[Dict[str, str]], model: str,
+                                  max_tokens: int, temperature: float, priority: str,
+                                  route: Optional[str] = None):
+        """
+        排队获准后打开上游流式响应，并发名额在流结束时释放
+        """
+        estimated_tokens = self._estimate_tokens(messages, max_tokens)
+
+        async def open_stream(candidate: str):
+            slot = await llm_scheduler.acquire(candidate, priority, estimated_tokens)
+            started_at = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=candidate,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True
+                )
+            except Exception as e:
+                slot.release(0)
+                self._record_usage("chat_stream", candidate, started_at, error=e)
+                raise
+            return response, slot, candidate, started_at
+
+        # 只有打开流的阶段可以重试，开始产出分片后不再重试
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                stream=stream
-            )
+            response, slot, used_model, started_at = await llm_router.call(route, model, open_stream)
+        except Exception as e:
+            raise Exception(f"LLM API error: {str(e)}") from e
+
+        return self._iterate_chat_stream(response, slot, estimated_tokens - max_tokens, used_model, started_at)
 
-            if stream:
-                return response
+    async def _iterate_chat_stream(self, response, slot, prompt_tokens: int, model: str, started_at: float):
+        """
+        把上游分片规范化为增量事件，结束时产出done事件；流式响应没有usage，生成的token数按文本估算
+        """
+        parts: List[str] = []
+        finish_reason = None
+        try:
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                    yield {"type": "delta", "content": choice.delta.content}
 
-            result = {
-                "content": response.choices[0].message.content,
-                "role": response.choices[0].message.role,
+            completion_tokens = text_chunker.count_tokens("".join(parts))
+            yield {
+                "type": "done",
+                "finish_reason": finish_reason,
                 "model_used": model,
-                "tokens_used": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                } if response.usage else None
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "estimated": True
+                }
             }
+        finally:
+            completion_tokens = text_chunker.count_tokens("".join(parts))
+            slot.release(prompt_tokens + completion_tokens)
+            self._record_usage("chat_stream", model, started_at, prompt_tokens, completion_tokens)
+            await response.response.aclose()
 
-            return result
+    @staticmethod
+    def _record_usage(operation: str, model: str, started_at: float, prompt_tokens: int = 0,
+                      completion_tokens: int = 0, error: Optional[BaseException] = None):
+        """
+        记录一次上游调用的用量、延迟和错误，归属取自调用方的 usage_context
+        """
+        llm_usage_tracker.record(
+            operation, model, prompt_tokens, completion_tokens,
+            latency=time.perf_counter() - started_at,
+            error=type(error).__name__ if error is not None else None
+        )
 
-        except Exception as e:
-            raise Exception(f"LLM API error: {str(e)}")
+    async def _create_chat_completion(self, messages: List[Dict[str, str]], model: str,
+                                      max_tokens: int, temperature: float,
+                                      priority: str = DEFAULT_LANE) -> Dict[str, Any]:
+        """
+        排队获准后向上游发送一次非流式请求（错误原样抛出，由调用方决定是否重试）
+        """
+        async with await llm_scheduler.acquire(
+            model, priority, self._estimate_tokens(messages, max_tokens)
+        ) as slot:
+            started_at = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+            except Exception as e:
+                self._record_usage("chat", model, started_at, error=e)
+                raise
+            slot.release(response.usage.total_tokens if response.usage else None)
+            self._record_usage(
+                "chat", model, started_at,
+                response.usage.prompt_tokens if response.usage else 0,
+                response.usage.completion_tokens if response.usage else 0
+            )
+
+        return {
+            "content": response.choices[0].message.content,
+            "role": response.choices[0].message.role,
+            "model_used": model,
+            "tokens_used": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens
+            } if response.usage else None
+        }
 
     async def analyze_image(
         self,
         image_url: str,
         prompt: str = "Describe this image in detail.",
-        model: str = "gpt-4-vision-preview"
+        model: str = "gpt-4-vision-preview",
+        priority: str = DEFAULT_LANE,
+        detail: str = "high",
+        cache: bool = True
     ) -> Dict[str, Any]:
         """
         分析图像内容
+
+        上传目录内的本地图像先缩放、重新编码为data URL（按内容哈希缓存），远程URL原样转发。
+        cache为True时相同图像内容和提示的分析结果直接复用。
         """
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
+            prepared = await image_preprocessor.prepare(image_url, detail)
+        except Exception as e:
+            raise Exception(f"Image analysis error: {str(e)}")
+
+        # 本地图像按内容哈希做缓存键，同一张图重复上传也能命中
+        request_key = llm_response_cache.make_key(
+            image=prepared["content_hash"] or image_url, prompt=prompt, model=model, detail=detail
+        )
+        use_cache = settings.llm_cache_enabled and cache
+        if use_cache:
+            cached = await llm_response_cache.get(request_key)
+            if cached is not None:
+                llm_usage_tracker.record("image_analysis", model, cached=True)
+                return {**cached, "cached": True}
+
+        async def analyze(candidate: str):
+            async with await llm_scheduler.acquire(
+                candidate, priority, text_chunker.count_tokens(prompt) + 500
+            ) as slot:
+                started_at = time.perf_counter()
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=candidate,
+                        messages=[
                             {
-                                "type": "image_url",
-                                "image_url": {"url": image_url}
+                                "role": "user",
+                                "content": [
+                                    {"type": "text", "text": prompt},
+                                    {
+                                        "type": "image_url",
+                                        "image_url": {"url": prepared["url"], "detail": detail}
+                                    }
+                                ]
                             }
-                        ]
-                    }
-                ],
-                max_tokens=500
-            )
+                        ],
+                        max_tokens=500
+                    )
+                except Exception as e:
+                    self._record_usage("image_analysis", candidate, started_at, error=e)
+                    raise
+                slot.release(response.usage.total_tokens if response.usage else None)
+                self._record_usage(
+                    "image_analysis", candidate, started_at,
+                    response.usage.prompt_tokens if response.usage else 0,
+                    response.usage.completion_tokens if response.usage else 0
+                )
 
             return {
                 "analysis": response.choices[0].message.content,
-                "model_used": model,
+                "model_used": candidate,
                 "tokens_used": response.usage.total_tokens if response.usage else None
             }
 
+        try:
+            result = await llm_resilience.call(model, analyze)
         except Exception as e:
             raise Exception(f"Image analysis error: {str(e)}")
+        if use_cache:
+            await llm_response_cache.set(request_key, result)
+        return result
 
     async def transcribe_audio(
         self,
@@ -94,12 +328,25 @@ class LLMService:
         转录音频文件
         """
         try:
-            with open(audio_file_path, "rb") as audio_file:
-                response = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language=language
-                )
+            async with aiofiles.open(audio_file_path, "rb") as audio_file:
+                audio_data = await audio_file.read()
+
+            async def transcribe(candidate: str):
+                async with await llm_scheduler.acquire(candidate):
+                    started_at = time.perf_counter()
+                    try:
+                        response = await self.client.audio.transcriptions.create(
+                            model=candidate,
+                            file=(os.path.basename(audio_file_path), audio_data),
+                            language=language
+                        )
+                    except Exception as e:
+                        self._record_usage("transcription", candidate, started_at, error=e)
+                        raise
+                    self._record_usage("transcription", candidate, started_at)
+                    return response
+
+            response = await llm_resilience.call("whisper-1", transcribe)
 
             return {
                 "text": response.text,
@@ -116,42 +363,173 @@ class LLMService:
         model: str = "tts-1"
     ) -> str:
         """
-        文本转语音
+        文本转语音，返回音频文件路径
+
+        结果按 (文本, 音色, 模型) 缓存在磁盘上，重复的文本直接返回已有文件。
         """
-        try:
-            response = self.client.audio.speech.create(
-                model=model,
-                voice=voice,
-                input=text
-            )
+        key = tts_cache.make_key(text, voice, model, "openai")
+        cached_path = tts_cache.lookup(key)
+        if cached_path is not None:
+            llm_usage_tracker.record("tts", model, cached=True)
+            return cached_path
 
-            # 保存音频文件
-            output_file = f"tts_output_{hash(text)}.mp3"
-            response.stream_to_file(output_file)
+        async def synthesize_to_cache():
+            async def synthesize(candidate: str):
+                async with await llm_scheduler.acquire(candidate):
+                    started_at = time.perf_counter()
+                    try:
+                        response = await self.client.audio.speech.create(
+                            model=candidate,
+                            voice=voice,
+                            input=text
+                        )
+                    except Exception as e:
+                        self._record_usage("tts", candidate, started_at, error=e)
+                        raise
+                    # TTS按输入字符数计费
+                    self._record_usage("tts", candidate, started_at, len(text))
+                    return response
 
-            return output_file
+            response = await llm_resilience.call(model, synthesize)
+            return await asyncio.to_thread(tts_cache.store, key, response.content)
 
+        try:
+            return await self._tts_flight.do(key, synthesize_to_cache)
         except Exception as e:
             raise Exception(f"Text-to-speech error: {str(e)}")
 
     async def generate_embeddings(
         self,
         text: str,
-        model: str = "text-embedding-ada-002"
+        model: str = "text-embedding-ada-002",
+        priority: str = DEFAULT_LANE
     ) -> List[float]:
         """
         生成文本嵌入向量
         """
-        try:
-            response = self.client.embeddings.create(
-                model=model,
-                input=text
+        async def embed():
+            return (await self.generate_embeddings_batch([text], model, priority))[0]
+
+        if settings.llm_single_flight_enabled:
+            return await self._embedding_flight.do((model, text), embed)
+        return await embed()
+
+    async def generate_embeddings_batch(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-ada-002",
+        priority: str = DEFAULT_LANE
+    ) -> List[List[float]]:
+        """
+        批量生成文本嵌入向量，返回顺序与输入一致
+
+        先查内容哈希缓存，未命中的文本去重后按条数和token数拆成多个请求，有限并发发送。
+        """
+        keys = [embedding_cache.make_key(model=model, input=text) for text in texts]
+        vectors: Dict[str, List[float]] = await embedding_cache.get_many(list(set(keys)))
+
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                pending[key] = text
+
+        if pending:
+            semaphore = asyncio.Semaphore(max(1, settings.embedding_batch_concurrency))
+
+            async def run(batch: List[Tuple[str, str, int]]):
+                async with semaphore:
+                    batch_vectors = await self._embed_batch(batch, model, priority)
+                vectors.update(batch_vectors)
+                await embedding_cache.set_many(batch_vectors)
+
+            try:
+                await asyncio.gather(*(run(batch) for batch in self._split_embedding_batches(pending)))
+            except Exception as e:
+                raise Exception(f"Embedding generation error: {str(e)}")
+
+        return [vectors[key] for key in keys]
+
+    @staticmethod
+    def _split_embedding_batches(pending: Dict[str, str]) -> List[List[Tuple[str, str, int]]]:
+        """
+        按单次请求的条数和token上限拆分批次
+        """
+        batches: List[List[Tuple[str, str, int]]] = []
+        current: List[Tuple[str, str, int]] = []
+        current_tokens = 0
+        for key, text in pending.items():
+            tokens = text_chunker.count_tokens(text)
+            if current and (len(current) >= settings.embedding_batch_size
+                            or current_tokens + tokens > settings.embedding_batch_max_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append((key, text, tokens))
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_batch(self, batch: List[Tuple[str, str, int]], model: str,
+                           priority: str) -> Dict[str, List[float]]:
+        """
+        发送一个批量embedding请求，返回 {缓存键: 向量}
+        """
+        async def request(candidate: str):
+            async with await llm_scheduler.acquire(candidate, priority, sum(tokens for _, _, tokens in batch)):
+                started_at = time.perf_counter()
+                try:
+                    response = await self.client.embeddings.create(
+                        model=candidate,
+                        input=[text for _, text, _ in batch]
+                    )
+                except Exception as e:
+                    self._record_usage("embedding", candidate, started_at, error=e)
+                    raise
+            self._record_usage(
+                "embedding", candidate, started_at,
+                response.usage.prompt_tokens if response.usage else sum(tokens for _, _, tokens in batch)
             )
+            # 按返回的index对齐，不依赖返回顺序
+            ordered = sorted(response.data, key=lambda item: item.index)
+            return {key: item.embedding for (key, _, _), item in zip(batch, ordered)}
 
-            return response.data[0].embedding
+        # 备用模型的向量维度可能不同，embedding不做模型降级
+        return await llm_resilience.call(model, request, hedge=True, fallback=False)
 
-        except Exception as e:
-            raise Exception(f"Embedding generation error: {str(e)}")
+    def get_single_flight_stats(self) -> Dict[str, Any]:
+        """
+        请求合并统计
+        """
+        return {
+            "chat": self._chat_flight.get_stats(),
+            "stream": self._stream_flight.get_stats(),
+            "embedding": self._embedding_flight.get_stats(),
+            "tts": self._tts_flight.get_stats()
+        }
+
+    def get_resilience_stats(self) -> Dict[str, Any]:
+        """
+        重试、对冲和熔断统计
+        """
+        return llm_resilience.get_stats()
+
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """
+        各模型的并发、token预算和排队统计
+        """
+        return llm_scheduler.get_stats()
+
+    def get_router_stats(self) -> Dict[str, Any]:
+        """
+        各路由类别的选择结果和各模型的滑动窗口延迟、错误率
+        """
+        return llm_router.get_stats()
+
+    def get_usage_stats(self) -> Dict[str, Any]:
+        """
+        token用量、成本和延迟统计（按模型、调用方、操作类型）
+        """
+        return llm_usage_tracker.get_summary()
 
 # 全局LLM服务实例
 llm_service = LLMService()
\ No newline at end of file
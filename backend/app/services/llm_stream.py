@@ -0,0 +1,91 @@
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+
+class ChatStream:
+    """
+    chat_completion(stream=True) 返回的异步流
+
+    async for 依次产出规范化事件：
+      {"type": "delta", "content": "..."}
+      {"type": "done", "content": 完整文本, "finish_reason": ..., "model_used": ..., "usage": {...}, "timing": {...}}
+    usage为估算值（流式响应不返回用量）。timing从调用chat_completion开始计时，
+    包含首token时间（ttft）和token间隔。提前退出时调用 aclose() 或使用 async with，
+    没有其他订阅者时上游生成随之停止。
+    """
+    def __init__(self, subscription):
+        self._subscription = subscription
+        self._started_at = time.perf_counter()
+        self._first_delta_at: Optional[float] = None
+        self._last_delta_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._gaps: List[float] = []
+        self._parts: List[str] = []
+        self.finish_reason: Optional[str] = None
+        self.model_used: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+
+    def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        return self._events()
+
+    async def _events(self) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            async for event in self._subscription:
+                now = time.perf_counter()
+                if event["type"] == "delta":
+                    if self._first_delta_at is None:
+                        self._first_delta_at = now
+                    else:
+                        self._gaps.append(now - self._last_delta_at)
+                    self._last_delta_at = now
+                    self._parts.append(event["content"])
+                    yield event
+                elif event["type"] == "done":
+                    self._finished_at = now
+                    self.finish_reason = event.get("finish_reason")
+                    self.model_used = event.get("model_used")
+                    self.usage = event.get("usage")
+                    yield {**event, "content": self.text, "timing": self.get_timing()}
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        """取消订阅（可重复调用）"""
+        await self._subscription.aclose()
+
+    async def __aenter__(self) -> "ChatStream":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    @property
+    def text(self) -> str:
+        """目前为止收到的文本"""
+        return "".join(self._parts)
+
+    def get_timing(self) -> Dict[str, Any]:
+        """首token时间、总耗时和token间隔（秒）"""
+        end = self._finished_at or self._last_delta_at
+        gaps = sorted(self._gaps)
+        return {
+            "ttft": self._first_delta_at - self._started_at if self._first_delta_at is not None else None,
+            "total": end - self._started_at if end is not None else None,
+            "deltas": len(self._parts),
+            "inter_token_avg": sum(gaps) / len(gaps) if gaps else None,
+            "inter_token_p95": gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))] if gaps else None,
+            "inter_token_max": gaps[-1] if gaps else None
+        }
+
+    async def collect(self) -> Dict[str, Any]:
+        """读完整个流，返回与非流式chat_completion相同格式的结果（附带timing）"""
+        async for _ in self:
+            pass
+        return {
+            "content": self.text,
+            "role": "assistant",
+            "model_used": self.model_used,
+            "tokens_used": self.usage,
+            "finish_reason": self.finish_reason,
+            "timing": self.get_timing()
+        }
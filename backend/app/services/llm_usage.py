@@ -0,0 +1,167 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+from ..core.config import settings
+
+# 各模型单价（美元 / 1K token；TTS按1K字符计），可通过配置 llm_model_pricing 覆盖
+MODEL_PRICING = {
+    "gpt-3.5-turbo": {"prompt": 0.0015, "completion": 0.002},
+    "gpt-3.5-turbo-1106": {"prompt": 0.001, "completion": 0.002},
+    "gpt-3.5-turbo-16k": {"prompt": 0.003, "completion": 0.004},
+    "gpt-4": {"prompt": 0.03, "completion": 0.06},
+    "gpt-4-32k": {"prompt": 0.06, "completion": 0.12},
+    "gpt-4-1106-preview": {"prompt": 0.01, "completion": 0.03},
+    "gpt-4-vision-preview": {"prompt": 0.01, "completion": 0.03},
+    "gpt-4-turbo": {"prompt": 0.01, "completion": 0.03},
+    "gpt-4o": {"prompt": 0.005, "completion": 0.015},
+    "gpt-4o-mini": {"prompt": 0.00015, "completion": 0.0006},
+    "text-embedding-ada-002": {"prompt": 0.0001, "completion": 0.0},
+    "text-embedding-3-small": {"prompt": 0.00002, "completion": 0.0},
+    "text-embedding-3-large": {"prompt": 0.00013, "completion": 0.0},
+    "tts-1": {"prompt": 0.015, "completion": 0.0},
+    "tts-1-hd": {"prompt": 0.03, "completion": 0.0},
+}
+
+# 保留的最近调用记录数
+RECENT_RECORDS_SIZE = 1000
+
+# 按对话/协作汇总时最多保留的条目数（超出后淘汰最久未更新的）
+MAX_ROLLUP_ENTRIES = 10000
+
+# 当前调用的归属标签（caller / conversation_id / collaboration_id），随asyncio任务传递
+_usage_tags: ContextVar[Dict[str, Any]] = ContextVar("llm_usage_tags", default={})
+
+
+@contextmanager
+def usage_context(**tags):
+    """
+    在此上下文中发起的LLM调用都带上给定标签，嵌套时内层标签覆盖外层
+
+    用法: with usage_context(caller="memory.extraction", conversation_id=conversation_id): ...
+    """
+    token = _usage_tags.set({**_usage_tags.get(), **{k: v for k, v in tags.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _usage_tags.reset(token)
+
+
+def _empty_aggregate() -> Dict[str, Any]:
+    return {"calls": 0, "errors": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "total_tokens": 0, "cost": 0.0, "latency_total": 0.0, "latency_max": 0.0}
+
+
+class LLMUsageTracker:
+    """进程内的LLM用量与成本统计"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._totals = _empty_aggregate()
+        self._by_model: Dict[str, Dict[str, Any]] = {}
+        self._by_caller: Dict[str, Dict[str, Any]] = {}
+        self._by_operation: Dict[str, Dict[str, Any]] = {}
+        self._by_conversation: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._by_collaboration: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._recent: deque = deque(maxlen=RECENT_RECORDS_SIZE)
+
+    @staticmethod
+    def price_for(model: str) -> Dict[str, float]:
+        """模型单价，带日期后缀的模型名按最长前缀匹配"""
+        pricing = {**MODEL_PRICING, **settings.llm_model_pricing}
+        if model in pricing:
+            return pricing[model]
+        matches = [name for name in pricing if model.startswith(name)]
+        return pricing[max(matches, key=len)] if matches else {"prompt": 0.0, "completion": 0.0}
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.price_for(model)
+        return (prompt_tokens * price.get("prompt", 0.0) + completion_tokens * price.get("completion", 0.0)) / 1000.0
+
+    def record(self, operation: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+               latency: float = 0.0, cached: bool = False, error: Optional[str] = None,
+               caller: Optional[str] = None):
+        """记录一次调用；归属标签取自当前的 usage_context"""
+        tags = _usage_tags.get()
+        caller = caller or tags.get("caller") or "unknown"
+        cost = 0.0 if cached or error else self.estimate_cost(model, prompt_tokens, completion_tokens)
+
+        record = {
+            "timestamp": time.time(),
+            "operation": operation,
+            "model": model,
+            "caller": caller,
+            "conversation_id": tags.get("conversation_id"),
+            "collaboration_id": tags.get("collaboration_id"),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": latency,
+            "cost": cost,
+            "cached": cached,
+            "error": error
+        }
+
+        with self._lock:
+            self._recent.append(record)
+            targets = [
+                self._totals,
+                self._by_model.setdefault(model, _empty_aggregate()),
+                self._by_caller.setdefault(caller, _empty_aggregate()),
+                self._by_operation.setdefault(operation, _empty_aggregate())
+            ]
+            for rollup, key in ((self._by_conversation, record["conversation_id"]),
+                                (self._by_collaboration, record["collaboration_id"])):
+                if key is None:
+                    continue
+                targets.append(rollup.setdefault(key, _empty_aggregate()))
+                rollup.move_to_end(key)
+                while len(rollup) > MAX_ROLLUP_ENTRIES:
+                    rollup.popitem(last=False)
+
+            for aggregate in targets:
+                aggregate["calls"] += 1
+                aggregate["errors"] += 1 if error else 0
+                aggregate["cached"] += 1 if cached else 0
+                aggregate["prompt_tokens"] += prompt_tokens
+                aggregate["completion_tokens"] += completion_tokens
+                aggregate["total_tokens"] += prompt_tokens + completion_tokens
+                aggregate["cost"] += cost
+                aggregate["latency_total"] += latency
+                aggregate["latency_max"] = max(aggregate["latency_max"], latency)
+
+    @staticmethod
+    def _format(aggregate: Dict[str, Any]) -> Dict[str, Any]:
+        result = {key: value for key, value in aggregate.items() if key != "latency_total"}
+        uncached = aggregate["calls"] - aggregate["cached"]
+        result["latency_avg"] = aggregate["latency_total"] / uncached if uncached else 0.0
+        result["cost"] = round(aggregate["cost"], 6)
+        return result
+
+    def get_summary(self) -> Dict[str, Any]:
+        """总量及按模型、调用方、操作类型的汇总"""
+        with self._lock:
+            return {
+                "since": self._started_at,
+                "totals": self._format(self._totals),
+                "by_model": {key: self._format(value) for key, value in self._by_model.items()},
+                "by_caller": {key: self._format(value) for key, value in self._by_caller.items()},
+                "by_operation": {key: self._format(value) for key, value in self._by_operation.items()}
+            }
+
+    def get_conversation_usage(self, conversation_id: Any) -> Dict[str, Any]:
+        with self._lock:
+            return self._format(self._by_conversation.get(conversation_id, _empty_aggregate()))
+
+    def get_collaboration_usage(self, collaboration_id: Any) -> Dict[str, Any]:
+        with self._lock:
+            return self._format(self._by_collaboration.get(collaboration_id, _empty_aggregate()))
+
+    def get_recent(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+
+# 全局LLM用量统计实例
+llm_usage_tracker = LLMUsageTracker()
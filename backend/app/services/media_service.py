@@ -1,11 +1,13 @@
 import os
 import uuid
+import hashlib
 from typing import Optional, Tuple
 from fastapi import UploadFile, HTTPException
 from PIL import Image
 import speech_recognition as sr
 import pyttsx3
 from ..core.config import settings
+from .tts_cache import tts_cache
 import aiofiles
 
 class MediaService:
@@ -18,6 +20,25 @@ class MediaService:
         """
         保存上传的文件
         """
+        file_path, _, _ = await self.save_upload_stream(file, subfolder)
+        return file_path
+
+    async def save_upload_stream(
+        self,
+        file: UploadFile,
+        subfolder: str = "general",
+        max_size: Optional[int] = None
+    ) -> Tuple[str, int, str]:
+        """
+        分块流式保存上传的文件，边写边计算SHA-256并校验大小
+
+        返回 (文件路径, 字节数, 内容哈希)。超过大小限制时中止并删除已写入的部分。
+        注意：调用到这里时Starlette已经把整个multipart请求体读完并暂存，这里的校验只能避免再完整读一遍；
+        在读取请求体之前拒绝超大上传由UploadSizeLimitMiddleware负责。
+        """
+        max_size = max_size or settings.max_file_size
+        file_path = None
+
         try:
             # 创建子文件夹
             folder_path = os.path.join(self.upload_dir, subfolder)
@@ -28,14 +49,32 @@ class MediaService:
             unique_filename = f"{uuid.uuid4()}.{file_extension}"
             file_path = os.path.join(folder_path, unique_filename)
 
-            # 保存文件
+            # 分块写入，内存占用与文件大小无关
+            hasher = hashlib.sha256()
+            size = 0
             async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
+                while True:
+                    chunk = await file.read(settings.upload_chunk_size)
+                    if not chunk:
+                        break
+
+                    size += len(chunk)
+                    if size > max_size:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File too large (limit {max_size} bytes)"
+                        )
+
+                    hasher.update(chunk)
+                    await f.write(chunk)
 
-            return file_path
+            return file_path, size, hasher.hexdigest()
 
         except Exception as e:
+            if file_path:
+                await self.delete_file(file_path)
+            if isinstance(e, HTTPException):
+                raise
             raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
     async def process_image(self, file_path: str) -> Tuple[str, dict]:
@@ -102,14 +141,23 @@ class MediaService:
                         self.tts_engine.setProperty('voice', voice.id)
                         break
 
-            # 生成音频文件
-            output_file = os.path.join(self.upload_dir, "tts", f"tts_{uuid.uuid4()}.mp3")
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
-            self.tts_engine.save_to_file(text, output_file)
-            self.tts_engine.runAndWait()
-
-            return output_file
+            # 相同文本和音色直接返回已合成的文件
+            key = tts_cache.make_key(text, voice_id, None, "pyttsx3")
+            cached_path = tts_cache.lookup(key)
+            if cached_path is not None:
+                return cached_path
+
+            # 生成音频文件，写完后再移入缓存
+            fd, tmp_path = tts_cache.temp_path(key)
+            os.close(fd)
+            try:
+                self.tts_engine.save_to_file(text, tmp_path)
+                self.tts_engine.runAndWait()
+            except Exception:
+                os.remove(tmp_path)
+                raise
+
+            return tts_cache.adopt(tmp_path, key)
 
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Text-to-speech error: {str(e)}")
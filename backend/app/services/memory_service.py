@@ -7,6 +7,7 @@ from ..models.models import Memory, WorkingMemory, User
 from ..models.schemas import MemoryCreate, MemoryResponse, WorkingMemoryUpdate, MemorySearchRequest
 from ..services.vector_service import vector_service
 from ..services.llm_service import llm_service
+from ..services.llm_usage import usage_context
 import nltk
 from nltk.tokenize import sent_tokenize
 from nltk.corpus import stopwords
@@ -265,10 +266,11 @@ class MemoryService:
             }}
             """
 
-            response = await llm_service.chat_completion([
-                {"role": "system", "content": "You are a memory extraction expert. Extract important information from conversations."},
-                {"role": "user", "content": extraction_prompt}
-            ])
+            with usage_context(caller="memory.extraction", conversation_id=conversation_id):
+                response = await llm_service.chat_completion([
+                    {"role": "system", "content": "You are a memory extraction expert. Extract important information from conversations."},
+                    {"role": "user", "content": extraction_prompt}
+                ], cache=True, priority="background")
 
             try:
                 # 解析LLM响应
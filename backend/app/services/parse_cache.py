@@ -0,0 +1,120 @@
+import os
+import zlib
+import hashlib
+import tempfile
+import threading
+from typing import Optional
+from ..core.config import settings
+
+
+class CompressedDiskCache:
+    """
+    按键存取文本的磁盘缓存
+
+    键由调用方给出，并加上namespace前缀，不同用途的缓存即使共用目录也不会互相命中；
+    值为zlib压缩的文本。总大小超过上限时按最近访问时间淘汰最旧的条目。
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, namespace: str):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    def _entry_path(self, key: str) -> str:
+        digest = hashlib.sha256(f"{self.namespace}:{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.z")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的文本，未命中返回None"""
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 更新访问时间，作为LRU淘汰依据
+            os.utime(path, None)
+            return zlib.decompress(data).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # 损坏的条目直接丢弃
+            self._remove(path)
+            return None
+
+    def put(self, key: str, text: str):
+        """写入缓存并按需淘汰旧条目"""
+        if self.max_bytes <= 0:
+            return
+
+        data = zlib.compress(text.encode("utf-8"))
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with self._lock:
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self._total_bytes += len(data) - previous
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _scan(self):
+        """列出所有条目 (路径, 大小, 最近访问时间)"""
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(".z"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """淘汰最久未访问的条目，直到总大小降到上限的90%"""
+        with self._lock:
+            target = int(self.max_bytes * 0.9)
+            for path, size, _ in sorted(self._scan(), key=lambda entry: entry[2]):
+                if self._total_bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self._total_bytes -= size
+                except FileNotFoundError:
+                    continue
+
+    def _remove(self, path: str):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+
+class ParsedTextCache(CompressedDiskCache):
+    """文档解析结果的磁盘缓存，键为文件内容哈希 + 提取器版本"""
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        super().__init__(
+            cache_dir or os.path.join(settings.upload_dir, "parse_cache"),
+            max_bytes if max_bytes is not None else settings.parse_cache_max_bytes,
+            namespace="parsed_text"
+        )
+
+
+# 全局解析结果缓存实例
+parsed_text_cache = ParsedTextCache()
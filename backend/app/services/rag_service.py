@@ -1,11 +1,13 @@
+from sqlalchemy import insert, update, or_, and_, func
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import os
 import json
+import pickle
+import hashlib
 import asyncio
 from datetime import datetime
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document as LangchainDocument
+import numpy as np
 from ..models.models import KnowledgeBase, Document, DocumentChunk
 from ..models.schemas import (
     KnowledgeBaseCreate, KnowledgeBaseResponse, DocumentUploadRequest,
@@ -13,6 +15,13 @@ from ..models.schemas import (
 )
 from ..services.vector_service import vector_service
 from ..services.llm_service import llm_service
+from ..services.llm_usage import usage_context
+from ..services.text_chunker import text_chunker
+from ..services.blob_store import text_blob_store
+from ..services.context_packer import context_packer, MAX_CONTEXT_TOKENS
+from ..services.answer_cache import rag_answer_cache
+from ..services.parse_cache import parsed_text_cache
+from ..core.config import settings
 import PyPDF2
 import docx
 import markdown
@@ -21,15 +30,29 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 每批处理的文档块数量（一次embedding计算 / 一条批量INSERT）
+CHUNK_INSERT_BATCH_SIZE = 256
+
+# 知识库支持的文档类型
+SUPPORTED_DOCUMENT_TYPES = ['pdf', 'docx', 'txt', 'md', 'html']
+
+# 文本提取逻辑的版本号，修改任一extract_text_from_*的输出时需递增，使解析缓存失效
+EXTRACTOR_VERSION = 1
+
 class DocumentProcessor:
     """文档处理器"""
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        # 分块器无调用状态，所有处理器共享同一实例
+        self.text_chunker = text_chunker
+
+    @staticmethod
+    def compute_file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+        """计算文件内容的SHA-256"""
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(block_size), b""):
+                hasher.update(block)
+        return hasher.hexdigest()
 
     def extract_text_from_pdf(self, file_path: str) -> str:
         """从PDF文件提取文本"""
@@ -91,10 +114,25 @@ class DocumentProcessor:
             logger.error(f"Error extracting text from TXT: {e}")
             return ""
 
-    def extract_text_from_file(self, file_path: str, file_type: str) -> str:
-        """根据文件类型提取文本"""
+    def extract_text_from_file(self, file_path: str, file_type: str,
+                               content_hash: Optional[str] = None) -> str:
+        """根据文件类型提取文本，相同内容的文件直接使用解析缓存"""
         file_type = file_type.lower()
 
+        if content_hash is None:
+            content_hash = self.compute_file_hash(file_path)
+        cache_key = f"{content_hash}:{file_type}:v{EXTRACTOR_VERSION}"
+
+        text = parsed_text_cache.get(cache_key)
+        if text is not None:
+            return text
+
+        text = self._extract_text(file_path, file_type)
+        if text:
+            parsed_text_cache.put(cache_key, text)
+        return text
+
+    def _extract_text(self, file_path: str, file_type: str) -> str:
         if file_type == 'pdf':
             return self.extract_text_from_pdf(file_path)
         elif file_type in ['doc', 'docx']:
@@ -110,18 +148,11 @@ class DocumentProcessor:
             return ""
 
     def split_text_into_chunks(self, text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
-        """将文本分割成块"""
+        """将文本分割成块（chunk_size 和 chunk_overlap 以token计）"""
+        # 参数不合法时直接报错，不退化为整篇文本一个块
+        self.text_chunker.validate_params(chunk_size, chunk_overlap)
         try:
-            # 更新文本分割器的配置
-            self.text_splitter.chunk_size = chunk_size
-            self.text_splitter.chunk_overlap = chunk_overlap
-
-            # 创建Langchain文档
-            langchain_doc = LangchainDocument(page_content=text)
-
-            # 分割文档
-            chunks = self.text_splitter.split_documents([langchain_doc])
-            return [chunk.page_content for chunk in chunks]
+            return self.text_chunker.split_text(text, chunk_size, chunk_overlap)
         except Exception as e:
             logger.error(f"Error splitting text into chunks: {e}")
             return [text]  # 如果分割失败，返回整个文本作为单个块
@@ -138,7 +169,10 @@ class RAGService:
             knowledge_base = KnowledgeBase(
                 name=kb_data.name,
                 description=kb_data.description,
-                user_id=kb_data.user_id
+                user_id=kb_data.user_id,
+                document_count=0,
+                chunk_count=0,
+                document_type_counts={}
             )
 
             self.db.add(knowledge_base)
@@ -152,22 +186,41 @@ class RAGService:
             raise Exception(f"Failed to create knowledge base: {e}")
 
     async def upload_document(self, upload_request: DocumentUploadRequest, file_path: str,
-                            original_name: str, file_type: str) -> Dict[str, Any]:
+                            original_name: str, file_type: str,
+                            content_hash: Optional[str] = None) -> Dict[str, Any]:
         """上传并处理文档"""
         try:
-            # 提取文本
-            text_content = self.document_processor.extract_text_from_file(file_path, file_type)
+            if content_hash is None:
+                content_hash = await asyncio.to_thread(self.document_processor.compute_file_hash, file_path)
+
+            # 内容寻址去重：相同内容且分块参数一致时直接引用已有的文本、块和向量
+            source = self._find_source_document(
+                content_hash, upload_request.chunk_size, upload_request.chunk_overlap
+            )
+            if source:
+                return self._reuse_document(source, upload_request, file_path, original_name)
+
+            # 提取文本（内容相同但分块参数不同时复用已提取的文本）
+            text_content = await self._find_extracted_text(content_hash)
+            if not text_content:
+                text_content = await asyncio.to_thread(
+                    self.document_processor.extract_text_from_file, file_path, file_type, content_hash
+                )
 
             if not text_content:
                 raise Exception("Failed to extract text from document")
 
-            # 分割文本
-            chunks = self.document_processor.split_text_into_chunks(
+            # 分割文本（解析和分块都在线程中执行，不阻塞事件循环）
+            chunks = await asyncio.to_thread(
+                self.document_processor.split_text_into_chunks,
                 text_content,
                 upload_request.chunk_size,
                 upload_request.chunk_overlap
             )
 
+            # 全文压缩存储到磁盘，文档表只保存引用
+            content_blob = await asyncio.to_thread(text_blob_store.put, text_content)
+
             # 创建文档记录
             filename = os.path.basename(file_path)
             document = Document(
@@ -176,41 +229,35 @@ class RAGService:
                 original_name=original_name,
                 file_path=file_path,
                 file_type=file_type,
-                content=text_content,
+                content_blob=content_blob,
+                content_hash=content_hash,
+                chunk_size=upload_request.chunk_size,
+                chunk_overlap=upload_request.chunk_overlap,
                 chunk_count=len(chunks)
             )
 
+            # 先在事务外算好全部embedding，写库期间不再await，避免长时间持有SQLite写锁
+            embeddings = await self._embed_chunks(chunks)
+
+            # 文档记录、文档块和知识库计数在同一事务中写入并提交
             self.db.add(document)
+            self.db.flush()
+            chunk_ids = self._insert_chunks(document, chunks, embeddings)
+            self._adjust_knowledge_base_counters(
+                document.knowledge_base_id, file_type, documents=1, chunks=len(chunks)
+            )
             self.db.commit()
-            self.db.refresh(document)
-
-            # 创建文档块并生成embeddings
-            for i, chunk_content in enumerate(chunks):
-                chunk = DocumentChunk(
-                    document_id=document.id,
-                    content=chunk_content,
-                    chunk_index=i,
-                    metadata={
-                        "document_name": original_name,
-                        "chunk_size": len(chunk_content),
-                        "position": i
-                    }
-                )
-
-                self.db.add(chunk)
-                self.db.commit()
-                self.db.refresh(chunk)
 
-                # 添加到向量索引
-                await asyncio.to_thread(
-                    vector_service.add_document_chunk_embedding,
-                    chunk.id, chunk_content, self.db
-                )
+            # 添加到向量索引
+            await asyncio.to_thread(
+                vector_service.add_document_chunk_embeddings, chunk_ids, embeddings
+            )
 
             return {
                 "document_id": document.id,
                 "filename": original_name,
                 "chunk_count": len(chunks),
+                "deduplicated": False,
                 "processing_time": None  # 可以添加处理时间统计
             }
 
@@ -218,6 +265,140 @@ class RAGService:
             self.db.rollback()
             raise Exception(f"Failed to upload document: {e}")
 
+    def _find_source_document(self, content_hash: str, chunk_size: int, chunk_overlap: int) -> Optional[Document]:
+        """查找内容和分块参数都相同的原始文档（非引用文档）"""
+        return self.db.query(Document).filter(
+            Document.content_hash == content_hash,
+            Document.chunk_size == chunk_size,
+            Document.chunk_overlap == chunk_overlap,
+            Document.source_document_id.is_(None)
+        ).first()
+
+    async def _find_extracted_text(self, content_hash: str) -> Optional[str]:
+        """查找相同内容文件已提取的文本"""
+        row = self.db.query(Document.content_blob).filter(
+            Document.content_hash == content_hash,
+            Document.content_blob.isnot(None)
+        ).first()
+        if row:
+            return await asyncio.to_thread(text_blob_store.get, row[0])
+
+        row = self.db.query(Document.content).filter(
+            Document.content_hash == content_hash,
+            Document.content.isnot(None)
+        ).first()
+        return row[0] if row else None
+
+    async def _load_document_text(self, document: Document) -> Optional[str]:
+        """显式加载文档全文（压缩存储优先，兼容旧的内联content）"""
+        if document.content_blob:
+            return await asyncio.to_thread(text_blob_store.get, document.content_blob)
+        return document.content
+
+    def _release_content_blob(self, content_blob: Optional[str], document_id: int):
+        """没有其他文档引用时删除压缩全文"""
+        if not content_blob:
+            return
+        still_used = self.db.query(Document.id).filter(
+            Document.content_blob == content_blob,
+            Document.id != document_id
+        ).first()
+        if not still_used:
+            text_blob_store.delete(content_blob)
+
+    def _reuse_document(self, source: Document, upload_request: DocumentUploadRequest,
+                        file_path: str, original_name: str) -> Dict[str, Any]:
+        """以引用方式复用已有文档，不重新解析、分块和生成embedding"""
+        knowledge_base_id = upload_request.knowledge_base_id
+
+        # 同一知识库中已有该内容（原件或引用）时直接返回
+        document = self.db.query(Document).filter(
+            Document.knowledge_base_id == knowledge_base_id,
+            or_(Document.id == source.id, Document.source_document_id == source.id)
+        ).first()
+
+        if not document:
+            document = Document(
+                knowledge_base_id=knowledge_base_id,
+                filename=source.filename,
+                original_name=original_name,
+                file_path=source.file_path,
+                file_type=source.file_type,
+                content_blob=source.content_blob,
+                content_hash=source.content_hash,
+                chunk_size=source.chunk_size,
+                chunk_overlap=source.chunk_overlap,
+                source_document_id=source.id,
+                chunk_count=source.chunk_count
+            )
+
+            self.db.add(document)
+            self._adjust_knowledge_base_counters(
+                knowledge_base_id, source.file_type, documents=1, chunks=source.chunk_count or 0
+            )
+            self.db.commit()
+            self.db.refresh(document)
+
+        # 新上传的副本与已有文件内容相同，无需保留
+        if os.path.abspath(file_path) != os.path.abspath(document.file_path) and os.path.exists(file_path):
+            os.remove(file_path)
+
+        logger.info(f"Deduplicated upload {original_name} onto document {source.id}")
+
+        return {
+            "document_id": document.id,
+            "filename": original_name,
+            "chunk_count": document.chunk_count,
+            "deduplicated": True,
+            "processing_time": None
+        }
+
+    async def _embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """分批生成文档块的embedding（不访问数据库）"""
+        batch_embeddings = []
+        for start in range(0, len(chunks), CHUNK_INSERT_BATCH_SIZE):
+            batch = chunks[start:start + CHUNK_INSERT_BATCH_SIZE]
+            batch_embeddings.append(
+                await asyncio.to_thread(vector_service.batch_text_to_embeddings, batch)
+            )
+
+        if not batch_embeddings:
+            return np.empty((0, vector_service.embedding_dim), dtype=np.float32)
+
+        return np.vstack(batch_embeddings)
+
+    def _insert_chunks(self, document: Document, chunks: List[str], embeddings: np.ndarray,
+                       extra_metadata: Optional[Dict[str, Any]] = None) -> List[int]:
+        """批量写入文档块及其embedding（不提交事务），返回块ID"""
+        chunk_ids: List[int] = []
+
+        for start in range(0, len(chunks), CHUNK_INSERT_BATCH_SIZE):
+            batch = chunks[start:start + CHUNK_INSERT_BATCH_SIZE]
+            rows = []
+            for offset, chunk_content in enumerate(batch):
+                position = start + offset
+                rows.append({
+                    "document_id": document.id,
+                    "content": chunk_content,
+                    "chunk_index": position,
+                    "embedding": pickle.dumps(embeddings[position]),
+                    "metadata": {
+                        "document_name": document.original_name,
+                        "chunk_size": len(chunk_content),
+                        "position": position,
+                        **(extra_metadata or {})
+                    }
+                })
+
+            # 一条批量INSERT写入整批，并按参数顺序返回ID
+            result = self.db.execute(
+                insert(DocumentChunk).returning(DocumentChunk.id, sort_by_parameter_order=True),
+                rows
+            )
+            chunk_ids.extend(result.scalars().all())
+
+        return chunk_ids
+
     async def search_knowledge_base(self, search_request: RAGSearchRequest) -> List[RAGSearchResult]:
         """搜索知识库"""
         try:
@@ -230,6 +411,14 @@ class RAGService:
                 db=self.db
             )
 
+            # 把命中块扩展为相邻块窗口
+            if search_request.neighbor_window > 0 and search_results:
+                search_results = self._expand_neighbor_windows(
+                    search_results,
+                    search_request.neighbor_window,
+                    search_request.max_context_tokens or MAX_CONTEXT_TOKENS
+                )
+
             # 转换为RAGSearchResult
             results = []
             for result in search_results:
@@ -248,20 +437,125 @@ class RAGService:
             logger.error(f"Error searching knowledge base: {e}")
             return []
 
-    async def generate_rag_response(self, query: str, search_results: List[RAGSearchResult],
-                                 context: Optional[Dict[str, Any]] = None,
-                                 model: str = "gpt-3.5-turbo") -> Dict[str, Any]:
-        """生成RAG增强的响应"""
+    def _expand_neighbor_windows(self, hits: List[Dict[str, Any]], window: int,
+                                 max_tokens: int) -> List[Dict[str, Any]]:
+        """把命中块扩展为前后各window个相邻块，重叠的窗口合并，总token数不超过max_tokens"""
+        # 同一文档的候选区间先合并，再用一次范围查询取出全部相邻块
+        ranges: Dict[int, List[Tuple[int, int]]] = {}
+        for hit in hits:
+            ranges.setdefault(hit["source_document_id"], []).append(
+                (max(0, hit["chunk_index"] - window), hit["chunk_index"] + window)
+            )
+
+        conditions = []
+        for owner_id, intervals in ranges.items():
+            intervals.sort()
+            merged = [intervals[0]]
+            for start, end in intervals[1:]:
+                if start <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            conditions.extend(
+                and_(DocumentChunk.document_id == owner_id, DocumentChunk.chunk_index.between(start, end))
+                for start, end in merged
+            )
+
         try:
-            # 构建上下文
-            context_text = ""
-            if search_results:
-                context_text = "Relevant information from knowledge base:\n\n"
-                for i, result in enumerate(search_results, 1):
-                    context_text += f"[{i}] {result.content}\n\n"
-
-            # 构建RAG提示
-            rag_prompt = f"""
+            rows = self.db.query(
+                DocumentChunk.document_id, DocumentChunk.chunk_index, DocumentChunk.content
+            ).filter(or_(*conditions)).all()
+        except Exception as e:
+            logger.error(f"Error loading neighbor chunks: {e}")
+            return hits
+
+        contents = {(owner_id, index): content for owner_id, index, content in rows}
+        chunker = context_packer.chunker
+
+        # 命中块本身始终保留
+        ordered = sorted(hits, key=lambda x: x["score"], reverse=True)
+        hit_by_key = {}
+        for hit in ordered:
+            key = (hit["source_document_id"], hit["chunk_index"])
+            contents.setdefault(key, hit["content"])
+            hit_by_key.setdefault(key, hit)
+        selected = set(hit_by_key)
+        tokens_used = sum(chunker.count_tokens(contents[key]) for key in selected)
+
+        # 由近及远逐圈扩展，高分命中优先，超出预算的块跳过
+        for distance in range(1, window + 1):
+            for hit in ordered:
+                owner_id, index = hit["source_document_id"], hit["chunk_index"]
+                for neighbor, inner in ((index - distance, index - distance + 1),
+                                        (index + distance, index + distance - 1)):
+                    key = (owner_id, neighbor)
+                    # 只在窗口保持连续时扩展
+                    if key in selected or key not in contents or (owner_id, inner) not in selected:
+                        continue
+                    tokens = chunker.count_tokens(contents[key])
+                    if tokens_used + tokens > max_tokens:
+                        continue
+                    selected.add(key)
+                    tokens_used += tokens
+
+        # 同一文档中连续的块合并为一个结果
+        expanded = []
+        for owner_id in ranges:
+            indices = sorted(index for doc_id, index in selected if doc_id == owner_id)
+            runs = [[indices[0]]]
+            for index in indices[1:]:
+                if index == runs[-1][-1] + 1:
+                    runs[-1].append(index)
+                else:
+                    runs.append([index])
+
+            for run in runs:
+                run_hits = [hit_by_key[(owner_id, index)] for index in run if (owner_id, index) in hit_by_key]
+                best = max(run_hits, key=lambda x: x["score"])
+                expanded.append({
+                    **best,
+                    "content": context_packer.join_chunks([contents[(owner_id, index)] for index in run]),
+                    "chunk_index": run[0],
+                    "metadata": {
+                        **(best.get("metadata") or {}),
+                        "window": [run[0], run[-1]],
+                        "hit_chunk_indices": [index for index in run if (owner_id, index) in hit_by_key]
+                    }
+                })
+
+        return sorted(expanded, key=lambda x: x["score"], reverse=True)
+
+    def _build_rag_messages(self, query: str, search_results: List[RAGSearchResult],
+                            context: Optional[Dict[str, Any]] = None,
+                            model: str = "gpt-3.5-turbo",
+                            max_tokens: int = 2048) -> Tuple[List[Dict[str, str]], str, Dict[str, Any]]:
+        """构建RAG提示消息，返回 (消息列表, 上下文文本, 上下文打包统计)；打包统计中的sources与提示中的[i]编号一一对应"""
+        additional_context = json.dumps(context, ensure_ascii=False) if context else ""
+
+        # 按模型的token预算打包检索结果（去重、合并相邻块、按分数装填）
+        budget = context_packer.budget_for_model(
+            model, max_tokens, context_packer.chunker.count_tokens(query + additional_context)
+        )
+        packing = context_packer.pack([
+            {
+                "content": result.content,
+                "score": result.score,
+                "document_id": result.document_id,
+                "chunk_index": result.chunk_index,
+                "last_chunk_index": (result.metadata or {}).get("window", [result.chunk_index] * 2)[1]
+            } for result in search_results
+        ], budget)
+        packing["sources"] = self._packed_sources(packing["items"])
+
+        # 构建上下文
+        context_text = ""
+        if packing["items"]:
+            context_text = "Relevant information from knowledge base:\n\n"
+            for i, item in enumerate(packing["items"], 1):
+                context_text += f"[{i}] {item['content']}\n\n"
+
+        # 构建RAG提示
+        rag_prompt = f"""
             You are a helpful assistant with access to a knowledge base. Use the provided context to answer the user's question.
 
             Context from knowledge base:
@@ -275,20 +569,54 @@ class RAGService:
             3. Cite the source of information using [1], [2], etc.
             4. Be comprehensive and accurate
             5. If you're unsure, acknowledge the limitations
-
-            Additional Context: {json.dumps(context or {})}
+            """
+        if additional_context:
+            rag_prompt += f"""
+            Additional Context: {additional_context}
             """
 
+        messages = [
+            {"role": "system", "content": "You are a knowledgeable assistant with access to curated information sources."},
+            {"role": "user", "content": rag_prompt}
+        ]
+        return messages, context_text, packing
+
+    @staticmethod
+    def _packed_sources(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """实际放入提示的来源（去重、合并、排序之后），citation即提示中的引用编号"""
+        return [
+            {
+                "citation": i,
+                "content": item["content"],
+                "document_id": item.get("document_id"),
+                "chunk_index": item.get("chunk_index"),
+                "last_chunk_index": item.get("last_chunk_index", item.get("chunk_index")),
+                "score": item.get("score"),
+                "tokens": item.get("tokens")
+            } for i, item in enumerate(items, 1)
+        ]
+
+    async def generate_rag_response(self, query: str, search_results: List[RAGSearchResult],
+                                 context: Optional[Dict[str, Any]] = None,
+                                 model: str = "gpt-3.5-turbo") -> Dict[str, Any]:
+        """生成RAG增强的响应"""
+        try:
+            messages, context_text, packing = self._build_rag_messages(query, search_results, context, model)
+
             # 调用LLM生成响应
-            response = await llm_service.chat_completion([
-                {"role": "system", "content": "You are a knowledgeable assistant with access to curated information sources."},
-                {"role": "user", "content": rag_prompt}
-            ], model=model)
+            with usage_context(caller="rag"):
+                response = await llm_service.chat_completion(messages, model=model)
 
             return {
                 "response": response["content"],
-                "sources_used": len(search_results),
+                "sources": packing["sources"],
+                "sources_used": len(packing["sources"]),
                 "context_used": context_text,
+                "context_tokens": {
+                    "used": packing["tokens_used"],
+                    "saved": packing["tokens_saved"],
+                    "dropped": packing["tokens_dropped"]
+                },
                 "model_used": model,
                 "tokens_used": response.get("tokens_used")
             }
@@ -297,49 +625,153 @@ class RAGService:
             logger.error(f"Error generating RAG response: {e}")
             return {
                 "response": "I apologize, but I encountered an error while processing your request.",
+                "sources": [],
                 "sources_used": 0,
                 "error": str(e)
             }
 
-    async def get_knowledge_base_stats(self, knowledge_base_id: int) -> Dict[str, Any]:
-        """获取知识库统计信息"""
+    async def stream_rag_response(self, query: str, search_results: List[RAGSearchResult],
+                                  context: Optional[Dict[str, Any]] = None,
+                                  model: str = "gpt-3.5-turbo") -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成RAG增强的响应
+
+        先产出 {"type": "sources", "sources": [...]}（实际放入提示的来源），再产出ChatStream的增量事件和最终的done事件。
+        """
+        messages, _, packing = self._build_rag_messages(query, search_results, context, model)
+        yield {"type": "sources", "sources": packing["sources"]}
+
+        with usage_context(caller="rag.stream"):
+            stream = await llm_service.chat_completion(messages, model=model, stream=True)
+
         try:
-            # 获取文档数量
-            document_count = self.db.query(Document).filter(
-                Document.knowledge_base_id == knowledge_base_id
-            ).count()
-
-            # 获取文档块数量
-            chunk_count = self.db.query(DocumentChunk).filter(
-                Document.document_id.in_(
-                    self.db.query(Document.id).filter(
-                        Document.knowledge_base_id == knowledge_base_id
-                    )
-                )
-            ).count()
+            async for event in stream:
+                yield event
+        finally:
+            # 正常结束或客户端断开（生成器被取消/关闭）时关闭上游连接，停止生成
+            await stream.aclose()
+
+    async def answer_query(self, search_request: RAGSearchRequest, model: str = "gpt-3.5-turbo",
+                           context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """检索并生成RAG回答，优先使用语义缓存"""
+        cached, cache_key = await self.lookup_cached_answer(search_request, model, context)
+        if cached:
+            return {**cached["response"], "cached": True, "cache_similarity": cached["similarity"]}
+
+        search_results = await self.search_knowledge_base(search_request)
+        response = await self.generate_rag_response(search_request.query, search_results, context, model)
+        self.cache_answer(cache_key, response)
+
+        return {**response, "cached": False}
+
+    async def lookup_cached_answer(self, search_request: RAGSearchRequest, model: str,
+                                   context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple]]:
+        """查找语义缓存，返回 (缓存内容, 缓存键)；不可缓存时缓存键为None"""
+        if not settings.rag_cache_enabled or context:
+            return None, None
 
-            # 获取各种文档类型统计
-            document_types = {}
-            documents = self.db.query(Document).filter(
-                Document.knowledge_base_id == knowledge_base_id
-            ).all()
+        try:
+            group_key = rag_answer_cache.make_group_key(
+                search_request.knowledge_base_ids, model,
+                limit=search_request.limit, threshold=search_request.threshold,
+                neighbor_window=search_request.neighbor_window,
+                max_context_tokens=search_request.max_context_tokens
+            )
+            embedding = await asyncio.to_thread(vector_service.text_to_embedding, search_request.query)
+            generations = self._knowledge_base_generations(search_request.knowledge_base_ids)
 
-            for doc in documents:
-                doc_type = doc.file_type.lower()
-                document_types[doc_type] = document_types.get(doc_type, 0) + 1
+            cache_key = (group_key, embedding, generations)
+            return rag_answer_cache.lookup(*cache_key), cache_key
+
+        except Exception as e:
+            logger.error(f"Error looking up RAG answer cache: {e}")
+            return None, None
+
+    def cache_answer(self, cache_key: Optional[Tuple], response: Dict[str, Any]):
+        """缓存成功生成的回答（response中的sources即打包后的来源，命中时原样返回或回放）"""
+        if not cache_key or response.get("error"):
+            return
+        rag_answer_cache.store(*cache_key, {"response": response})
+
+    def _knowledge_base_generations(self, knowledge_base_ids: List[int]) -> Dict[int, int]:
+        """获取知识库当前的generation（未指定知识库时取全部）"""
+        query = self.db.query(KnowledgeBase.id, KnowledgeBase.generation)
+        if knowledge_base_ids:
+            query = query.filter(KnowledgeBase.id.in_(knowledge_base_ids))
+        return {kb_id: generation or 0 for kb_id, generation in query.all()}
+
+    async def get_knowledge_base_stats(self, knowledge_base_id: int) -> Dict[str, Any]:
+        """获取知识库统计信息（读取增量维护的计数）"""
+        try:
+            knowledge_base = self.db.query(KnowledgeBase).filter(
+                KnowledgeBase.id == knowledge_base_id
+            ).first()
+            if not knowledge_base:
+                return {}
+
+            # 计数尚未初始化（旧数据）时用聚合查询重建一次
+            if knowledge_base.document_type_counts is None:
+                self._rebuild_knowledge_base_counters(knowledge_base)
+                self.db.commit()
 
             return {
                 "knowledge_base_id": knowledge_base_id,
-                "document_count": document_count,
-                "chunk_count": chunk_count,
-                "document_types": document_types,
-                "last_updated": datetime.utcnow().isoformat()
+                "document_count": knowledge_base.document_count or 0,
+                "chunk_count": knowledge_base.chunk_count or 0,
+                "document_types": dict(knowledge_base.document_type_counts or {}),
+                "last_updated": (knowledge_base.updated_at or datetime.utcnow()).isoformat()
             }
 
         except Exception as e:
             logger.error(f"Error getting knowledge base stats: {e}")
+            self.db.rollback()
             return {}
 
+    def _rebuild_knowledge_base_counters(self, knowledge_base: KnowledgeBase):
+        """用一条分组聚合查询重新计算知识库计数（不读取content列）"""
+        file_type = func.lower(Document.file_type)
+        rows = self.db.query(
+            file_type,
+            func.count(Document.id),
+            func.coalesce(func.sum(Document.chunk_count), 0)
+        ).filter(
+            Document.knowledge_base_id == knowledge_base.id
+        ).group_by(file_type).all()
+
+        knowledge_base.document_type_counts = {doc_type: count for doc_type, count, _ in rows}
+        knowledge_base.document_count = sum(count for _, count, _ in rows)
+        knowledge_base.chunk_count = sum(chunks for _, _, chunks in rows)
+
+    def _adjust_knowledge_base_counters(self, knowledge_base_id: int, file_type: Optional[str],
+                                        documents: int = 0, chunks: int = 0):
+        """在当前事务中增量更新知识库计数，并递增generation"""
+        self.db.execute(
+            update(KnowledgeBase)
+            .where(KnowledgeBase.id == knowledge_base_id)
+            .values(
+                document_count=func.coalesce(KnowledgeBase.document_count, 0) + documents,
+                chunk_count=func.coalesce(KnowledgeBase.chunk_count, 0) + chunks,
+                generation=func.coalesce(KnowledgeBase.generation, 0) + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if not documents or not file_type:
+            return
+
+        knowledge_base = self.db.query(KnowledgeBase).filter(
+            KnowledgeBase.id == knowledge_base_id
+        ).first()
+        if not knowledge_base or knowledge_base.document_type_counts is None:
+            return
+
+        type_counts = dict(knowledge_base.document_type_counts)
+        doc_type = file_type.lower()
+        type_counts[doc_type] = type_counts.get(doc_type, 0) + documents
+        if type_counts[doc_type] <= 0:
+            del type_counts[doc_type]
+        knowledge_base.document_type_counts = type_counts
+
     async def update_document_index(self, document_id: int):
         """更新文档的向量索引"""
         try:
@@ -347,43 +779,55 @@ class RAGService:
             if not document:
                 return
 
-            # 删除旧的chunks
-            self.db.query(DocumentChunk).filter(
-                DocumentChunk.document_id == document_id
-            ).delete()
-
-            # 重新分割文本
-            chunks = self.document_processor.split_text_into_chunks(document.content)
+            # 引用文档与原始文档共享块，重建原始文档的索引
+            if document.source_document_id:
+                document = self.db.query(Document).filter(
+                    Document.id == document.source_document_id
+                ).first()
+                document_id = document.id
 
-            # 创建新的chunks
-            for i, chunk_content in enumerate(chunks):
-                chunk = DocumentChunk(
-                    document_id=document.id,
-                    content=chunk_content,
-                    chunk_index=i,
-                    metadata={
-                        "document_name": document.original_name,
-                        "chunk_size": len(chunk_content),
-                        "position": i,
-                        "reindexed_at": datetime.utcnow().isoformat()
-                    }
-                )
+            # 显式加载全文；旧的内联content顺便迁移到压缩存储
+            text_content = await self._load_document_text(document)
+            if not text_content:
+                raise Exception("Document has no extracted text")
+            if not document.content_blob:
+                document.content_blob = await asyncio.to_thread(text_blob_store.put, text_content)
+                document.content = None
+
+            # 重新分割文本（在线程中执行，不阻塞事件循环）
+            chunks = await asyncio.to_thread(
+                self.document_processor.split_text_into_chunks,
+                text_content,
+                document.chunk_size or 1000,
+                document.chunk_overlap if document.chunk_overlap is not None else 200
+            )
 
-                self.db.add(chunk)
-                self.db.commit()
-                self.db.refresh(chunk)
+            # 先算好embedding，再删除旧块、写入新块并提交，写库期间不再await
+            embeddings = await self._embed_chunks(chunks)
 
-                # 添加到向量索引
-                await asyncio.to_thread(
-                    vector_service.add_document_chunk_embedding,
-                    chunk.id, chunk_content, self.db
-                )
+            self.db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document_id
+            ).delete()
+            chunk_ids = self._insert_chunks(
+                document, chunks, embeddings, {"reindexed_at": datetime.utcnow().isoformat()}
+            )
 
-            # 更新文档信息
-            document.chunk_count = len(chunks)
+            # 更新文档信息（引用文档共享块，同步块数和所属知识库的计数/generation）
+            chunk_delta = len(chunks) - (document.chunk_count or 0)
+            references = self.db.query(Document).filter(
+                Document.source_document_id == document_id
+            ).all()
+            for doc in [document] + references:
+                doc.chunk_count = len(chunks)
+                self._adjust_knowledge_base_counters(doc.knowledge_base_id, None, chunks=chunk_delta)
             document.updated_at = datetime.utcnow()
             self.db.commit()
 
+            # 添加到向量索引
+            await asyncio.to_thread(
+                vector_service.add_document_chunk_embeddings, chunk_ids, embeddings
+            )
+
             logger.info(f"Reindexed document {document_id} with {len(chunks)} chunks")
 
         except Exception as e:
@@ -393,18 +837,43 @@ class RAGService:
     async def delete_document(self, document_id: int):
         """删除文档"""
         try:
-            # 删除文档块
-            self.db.query(DocumentChunk).filter(
-                DocumentChunk.document_id == document_id
-            ).delete()
-
-            # 删除文档
             document = self.db.query(Document).filter(Document.id == document_id).first()
-            if document:
-                self.db.delete(document)
+            if not document:
+                return
 
+            references = self.db.query(Document).filter(
+                Document.source_document_id == document_id
+            ).all()
+
+            if references:
+                # 仍被其他文档引用：把块和文本转交给第一个引用文档
+                heir = references[0]
+                self.db.query(DocumentChunk).filter(
+                    DocumentChunk.document_id == document_id
+                ).update({DocumentChunk.document_id: heir.id}, synchronize_session=False)
+
+                if not document.content_blob:
+                    heir.content = document.content
+                heir.source_document_id = None
+                for reference in references[1:]:
+                    reference.source_document_id = heir.id
+            elif document.source_document_id is None:
+                # 删除文档块（引用文档没有自己的块）
+                self.db.query(DocumentChunk).filter(
+                    DocumentChunk.document_id == document_id
+                ).delete()
+
+            # 删除文档
+            self._adjust_knowledge_base_counters(
+                document.knowledge_base_id, document.file_type,
+                documents=-1, chunks=-(document.chunk_count or 0)
+            )
+            content_blob = document.content_blob
+            self.db.delete(document)
             self.db.commit()
 
+            self._release_content_blob(content_blob, document_id)
+
             # 注意：这里可能需要从向量索引中移除相应的embeddings
             # 这取决于向量服务的具体实现
 
@@ -414,6 +883,10 @@ class RAGService:
             logger.error(f"Error deleting document: {e}")
             self.db.rollback()
 
+    def knowledge_base_exists(self, knowledge_base_id: int) -> bool:
+        """知识库是否存在"""
+        return self.db.query(KnowledgeBase.id).filter(KnowledgeBase.id == knowledge_base_id).first() is not None
+
     def get_user_knowledge_bases(self, user_id: Optional[int] = None) -> List[KnowledgeBaseResponse]:
         """获取用户的知识库列表"""
         try:
@@ -0,0 +1,212 @@
+import copy
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, AsyncIterator, Hashable
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求（异步版本）
+
+    同一个键同时只执行一次上游调用，其余调用者等待并共享结果。
+    单个调用者被取消不会取消共享的上游调用。
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """执行func()，若相同键的调用正在进行则等待其结果"""
+        self._stats["calls"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            return await asyncio.shield(task)
+
+        self._stats["coalesced"] += 1
+        # 跟随者拿到结果的副本，避免调用方修改共享对象
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._calls)}
+
+
+class ThreadSingleFlight:
+    """合并并发的相同请求（线程版本，用于同步的本地embedding计算）"""
+    def __init__(self):
+        self._calls: Dict[Hashable, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call["result"] = func()
+            except Exception as e:
+                call["error"] = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call["event"].set()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        call["event"].wait()
+        if call["error"] is not None:
+            raise call["error"]
+        return copy.deepcopy(call["result"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._calls)}
+
+
+class SharedStream:
+    """
+    多个订阅者共享的上游流
+
+    上游分片缓存在内存中，中途加入的订阅者先收到已缓存的前缀，再接收后续分片。
+    所有订阅者都退出后取消上游读取。
+    """
+    def __init__(self, opener: Callable[[], Awaitable[Any]], on_finish: Callable[[], None]):
+        self._opener = opener
+        self._on_finish = on_finish
+        self._detached = False
+        self._chunks: List[Any] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._subscribers = 0
+        self._changed = asyncio.Condition()
+        self._task = asyncio.create_task(self._pump())
+        self._task.add_done_callback(self._on_task_done)
+
+    def _detach(self):
+        """从StreamSingleFlight中移除（只执行一次），之后相同的请求会打开新的上游流"""
+        if not self._detached:
+            self._detached = True
+            self._on_finish()
+
+    async def _mark_done(self):
+        async with self._changed:
+            self._done = True
+            self._changed.notify_all()
+
+    def _on_task_done(self, task: asyncio.Task):
+        # 泵任务在第一次执行前就被取消时不会进入try，finally也不会执行；这里兜底移除登记并唤醒等待者
+        self._detach()
+        if not self._done:
+            if self._error is None:
+                self._error = asyncio.CancelledError()
+            asyncio.ensure_future(self._mark_done())
+
+    async def _pump(self):
+        upstream = None
+        try:
+            upstream = await self._opener()
+            async for chunk in upstream:
+                async with self._changed:
+                    self._chunks.append(chunk)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self._error = asyncio.CancelledError()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._detach()
+            if upstream is not None:
+                # 上游可以是异步生成器或openai的AsyncStream
+                if hasattr(upstream, "aclose"):
+                    await upstream.aclose()
+                elif hasattr(upstream, "response"):
+                    await upstream.response.aclose()
+            await self._mark_done()
+
+    def subscribe(self) -> "StreamSubscription":
+        self._subscribers += 1
+        return StreamSubscription(self)
+
+    def _unsubscribe(self):
+        self._subscribers -= 1
+        if self._subscribers <= 0 and not self._done:
+            # 先同步移除登记再取消：取消期间到达的相同请求会打开新的上游流，而不是加入正在结束的流
+            self._detach()
+            self._task.cancel()
+
+
+class StreamSubscription:
+    """SharedStream的一个订阅者，可 async for 迭代"""
+    def __init__(self, shared: SharedStream):
+        self._shared = shared
+        self._position = 0
+        self._closed = False
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        shared = self._shared
+        try:
+            while True:
+                async with shared._changed:
+                    while self._position >= len(shared._chunks) and not shared._done:
+                        await shared._changed.wait()
+                    chunks = shared._chunks[self._position:]
+                    done = shared._done
+
+                for chunk in chunks:
+                    self._position += 1
+                    yield chunk
+
+                if done and self._position >= len(shared._chunks):
+                    if isinstance(shared._error, asyncio.CancelledError):
+                        # 仍有订阅者时上游被取消（如事件循环关闭），不能当作正常结束
+                        raise RuntimeError("Shared upstream stream was cancelled")
+                    if shared._error is not None:
+                        raise shared._error
+                    return
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        """退出订阅；最后一个订阅者退出时停止上游"""
+        if not self._closed:
+            self._closed = True
+            self._shared._unsubscribe()
+
+
+class StreamSingleFlight:
+    """合并并发的相同流式请求"""
+    def __init__(self):
+        self._streams: Dict[Hashable, SharedStream] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def subscribe(self, key: Hashable, opener: Callable[[], Awaitable[Any]]) -> StreamSubscription:
+        """订阅key对应的流，不存在时调用opener()打开上游流"""
+        self._stats["calls"] += 1
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = SharedStream(opener, lambda: self._release(key, shared))
+            self._streams[key] = shared
+        else:
+            self._stats["coalesced"] += 1
+        return shared.subscribe()
+
+    def _release(self, key: Hashable, shared: SharedStream):
+        # 只移除自己的登记，不能误删同一个键上新打开的流
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._streams)}
@@ -0,0 +1,226 @@
+import threading
+from typing import List, Iterable, Iterator, Optional, Tuple
+import tiktoken
+
+# 句末标点（中英文）
+SENTENCE_ENDINGS = set("。！？；.!?;")
+
+# 边界优先级：段落 > 换行 > 句末 > 空白 > 任意字符边界
+PARAGRAPH_BOUNDARY = 4
+LINE_BOUNDARY = 3
+SENTENCE_BOUNDARY = 2
+WORD_BOUNDARY = 1
+CHAR_BOUNDARY = 0
+
+# 流式输入时，未处理文本累计到 chunk_size 的多少倍字符再切分一次
+STREAM_FLUSH_FACTOR = 16
+
+# 流式输入时，缓冲区末尾保留的token数（末尾的token可能随后续文本改变）
+STREAM_TAIL_MARGIN = 64
+
+
+class TokenTextChunker:
+    """按tiktoken token数切分文本的分块器
+
+    整段文本只编码一次，并在每个窗口内选择最合适的边界（段落、换行、句末、空白）。
+    实例不保存任何与单次调用相关的状态，可以在多个协程和线程之间共享。
+    编码在第一次使用时才加载（首次加载可能需要下载BPE文件），导入模块不会触发网络请求。
+    """
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encoding: Optional[tiktoken.Encoding] = None
+        self._encoding_lock = threading.Lock()
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        if self._encoding is None:
+            with self._encoding_lock:
+                if self._encoding is None:
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+        return self._encoding
+
+    @classmethod
+    def for_model(cls, model: str) -> "TokenTextChunker":
+        """根据模型名称选择对应的编码"""
+        try:
+            return cls(tiktoken.encoding_for_model(model).name)
+        except KeyError:
+            return cls()
+
+    def count_tokens(self, text: str) -> int:
+        """计算文本的token数"""
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    @staticmethod
+    def validate_params(chunk_size: int, chunk_overlap: int):
+        """校验分块参数：chunk_size 为正数，0 <= chunk_overlap < chunk_size"""
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if chunk_overlap < 0 or chunk_overlap >= chunk_size:
+            raise ValueError(
+                f"chunk_overlap must be between 0 and chunk_size - 1, got {chunk_overlap} for chunk_size {chunk_size}"
+            )
+
+    def split_text(self, text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+        """将文本切分为不超过 chunk_size 个token的块"""
+        self.validate_params(chunk_size, chunk_overlap)
+        chunks, _ = self._split(text, chunk_size, chunk_overlap, final=True)
+        return chunks
+
+    def iter_chunks(self, stream: Iterable[str], chunk_size: int = 1000,
+                    chunk_overlap: int = 200) -> Iterator[str]:
+        """从文本流中增量地切分出块，内存占用只与 chunk_size 有关"""
+        self.validate_params(chunk_size, chunk_overlap)
+        pieces: List[str] = []
+        pending = 0
+        flush_at = chunk_size * STREAM_FLUSH_FACTOR
+
+        for piece in stream:
+            pieces.append(piece)
+            pending += len(piece)
+            if pending < flush_at:
+                continue
+
+            buffer = "".join(pieces)
+            chunks, consumed = self._split(buffer, chunk_size, chunk_overlap, final=False)
+            yield from chunks
+
+            rest = buffer[consumed:]
+            pieces = [rest]
+            pending = 0
+
+        chunks, _ = self._split("".join(pieces), chunk_size, chunk_overlap, final=True)
+        yield from chunks
+
+    def _split(self, text: str, chunk_size: int, chunk_overlap: int,
+               final: bool) -> Tuple[List[str], int]:
+        """切分文本，返回块列表和已消费的字符数（非 final 时尾部留给下一轮）"""
+        if not text:
+            return [], 0
+
+        tokens = self.encoding.encode(text, disallowed_special=())
+        char_offsets, valid = self._boundary_offsets(tokens)
+        total = len(tokens)
+
+        chunks: List[str] = []
+        start = 0
+        while start < total:
+            remaining = total - start
+            if remaining <= chunk_size:
+                if not final:
+                    break
+                self._append_chunk(chunks, text[char_offsets[start]:])
+                start = total
+                break
+            if not final and remaining <= chunk_size + STREAM_TAIL_MARGIN:
+                break
+
+            end = self._choose_end(text, char_offsets, valid, start, chunk_size, chunk_overlap)
+
+            # 单独编码时token数可能与整体编码略有差异，超出预算则回退到更早的边界
+            chunk_text = text[char_offsets[start]:char_offsets[end]]
+            while end > start + 1 and self.count_tokens(chunk_text.strip()) > chunk_size:
+                end = self._previous_valid(valid, end - 1, start + 1)
+                chunk_text = text[char_offsets[start]:char_offsets[end]]
+            self._append_chunk(chunks, chunk_text)
+
+            start = self._choose_next_start(text, char_offsets, valid, start, end, chunk_overlap)
+
+        consumed = char_offsets[start] if start < total else len(text)
+        return chunks, consumed
+
+    def _boundary_offsets(self, tokens: List[int]) -> Tuple[List[int], List[bool]]:
+        """计算每个token边界对应的字符偏移，以及该边界是否落在完整字符上"""
+        char_offsets = [0]
+        valid = [True]
+        chars = 0
+        partial = 0  # 当前未完成的UTF-8字符还缺的字节数
+
+        for token_bytes in self.encoding.decode_tokens_bytes(tokens):
+            for byte in token_bytes:
+                if byte & 0xC0 == 0x80:
+                    partial -= 1
+                    continue
+                chars += 1
+                if byte >= 0xF0:
+                    partial = 3
+                elif byte >= 0xE0:
+                    partial = 2
+                elif byte >= 0xC0:
+                    partial = 1
+                else:
+                    partial = 0
+            char_offsets.append(chars)
+            valid.append(partial <= 0)
+
+        return char_offsets, valid
+
+    def _boundary_score(self, text: str, offset: int) -> int:
+        """评估在字符偏移 offset 处切分的质量"""
+        if offset <= 0 or offset >= len(text):
+            return PARAGRAPH_BOUNDARY
+
+        previous = text[offset - 1]
+        following = text[offset]
+        if previous == "\n":
+            return PARAGRAPH_BOUNDARY if offset >= 2 and text[offset - 2] == "\n" else LINE_BOUNDARY
+        if previous in SENTENCE_ENDINGS and (following.isspace() or not previous.isascii()):
+            return SENTENCE_BOUNDARY
+        if previous.isspace() or following.isspace():
+            return WORD_BOUNDARY
+        return CHAR_BOUNDARY
+
+    def _choose_end(self, text: str, char_offsets: List[int], valid: List[bool],
+                    start: int, chunk_size: int, chunk_overlap: int) -> int:
+        """在窗口后半段从后向前选择得分最高的边界"""
+        limit = start + chunk_size
+        lower = min(limit, start + max(chunk_size // 2, chunk_overlap + 1))
+
+        best, best_score = None, -1
+        for end in range(limit, lower - 1, -1):
+            if not valid[end]:
+                continue
+            score = self._boundary_score(text, char_offsets[end])
+            if score > best_score:
+                best, best_score = end, score
+                if score == PARAGRAPH_BOUNDARY:
+                    break
+
+        if best is None:
+            best = self._previous_valid(valid, lower - 1, start + 1)
+        return best
+
+    def _choose_next_start(self, text: str, char_offsets: List[int], valid: List[bool],
+                           start: int, end: int, chunk_overlap: int) -> int:
+        """确定下一块的起点：向前回退 chunk_overlap 个token，并尽量对齐到词边界"""
+        if chunk_overlap <= 0:
+            return end
+
+        first = max(start + 1, end - chunk_overlap)
+        fallback: Optional[int] = None
+        for candidate in range(first, end):
+            if not valid[candidate]:
+                continue
+            if fallback is None:
+                fallback = candidate
+            if self._boundary_score(text, char_offsets[candidate]) >= WORD_BOUNDARY:
+                return candidate
+        return fallback if fallback is not None else end
+
+    @staticmethod
+    def _previous_valid(valid: List[bool], position: int, lowest: int) -> int:
+        """从 position 向前查找落在完整字符上的边界"""
+        for candidate in range(position, lowest - 1, -1):
+            if valid[candidate]:
+                return candidate
+        return lowest
+
+    @staticmethod
+    def _append_chunk(chunks: List[str], chunk_text: str):
+        chunk_text = chunk_text.strip()
+        if chunk_text:
+            chunks.append(chunk_text)
+
+
+# 全局分块器实例（无调用状态，可并发共享；编码首次使用时加载）
+text_chunker = TokenTextChunker()
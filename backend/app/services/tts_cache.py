@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+from ..core.config import settings
+
+# 过期条目的清理间隔（秒），写入时顺带执行
+SWEEP_INTERVAL_SECONDS = 3600
+
+
+class TTSCache:
+    """
+    语音合成结果的磁盘缓存
+
+    键为 (引擎, 模型, 音色, 文本) 的稳定哈希，文件按哈希存放在 upload_dir/tts_cache 下。
+    超过 max_age_seconds 未被使用的条目过期；总大小超过上限时按最近访问时间淘汰。
+    """
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None,
+                 max_age_seconds: Optional[int] = None):
+        self.cache_dir = cache_dir or os.path.join(settings.upload_dir, "tts_cache")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.tts_cache_max_bytes
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else settings.tts_cache_max_age_seconds
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+        self._last_sweep = 0.0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(text: str, voice: Optional[str], model: Optional[str], engine: str) -> str:
+        """合成参数的稳定哈希（不依赖进程随机化的hash()）"""
+        payload = json.dumps([engine, model, voice, text], ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str, extension: str = "mp3") -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension}")
+
+    def lookup(self, key: str, extension: str = "mp3") -> Optional[str]:
+        """返回缓存文件路径，未命中或已过期返回None"""
+        path = self.path_for(key, extension)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._stats["misses"] += 1
+            return None
+
+        if self.max_age_seconds > 0 and time.time() - stat.st_mtime > self.max_age_seconds:
+            self._remove(path)
+            self._stats["misses"] += 1
+            return None
+
+        # 更新访问时间，作为过期和LRU淘汰依据
+        os.utime(path, None)
+        self._stats["hits"] += 1
+        return path
+
+    def store(self, key: str, data: bytes, extension: str = "mp3") -> str:
+        """写入音频数据，返回缓存文件路径"""
+        fd, tmp_path = self.temp_path(key)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self.adopt(tmp_path, key, extension)
+
+    def temp_path(self, key: str):
+        """在缓存目录中创建临时文件，供合成引擎直接写入，返回 (fd, 路径)"""
+        directory = os.path.dirname(self.path_for(key))
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    def adopt(self, tmp_path: str, key: str, extension: str = "mp3") -> str:
+        """把写好的临时文件原子地移入缓存，返回缓存文件路径"""
+        path = self.path_for(key, extension)
+        try:
+            size = os.path.getsize(tmp_path)
+            with self._lock:
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self._total_bytes += size - previous
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._stats["stores"] += 1
+        if (self.max_bytes > 0 and self._total_bytes > self.max_bytes) or \
+                time.time() - self._last_sweep > SWEEP_INTERVAL_SECONDS:
+            self._evict()
+        return path
+
+    def _scan(self):
+        """列出所有条目 (路径, 大小, 最近访问时间)"""
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """先删除过期条目，再淘汰最久未访问的条目，直到总大小降到上限的90%"""
+        with self._lock:
+            self._last_sweep = time.time()
+            target = int(self.max_bytes * 0.9) if self.max_bytes > 0 else float("inf")
+            expire_before = time.time() - self.max_age_seconds if self.max_age_seconds > 0 else 0
+            for path, size, accessed_at in sorted(self._scan(), key=lambda entry: entry[2]):
+                if self._total_bytes <= target and accessed_at >= expire_before:
+                    break
+                try:
+                    os.remove(path)
+                    self._total_bytes -= size
+                    self._stats["evictions"] += 1
+                except FileNotFoundError:
+                    continue
+
+    def _remove(self, path: str):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._total_bytes -= size
+                self._stats["evictions"] += 1
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "total_bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+# 全局TTS缓存实例
+tts_cache = TTSCache()
@@ -2,11 +2,13 @@ import numpy as np
 import faiss
 import pickle
 import os
+import threading
 from typing import List, Dict, Any, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 from sqlalchemy.orm import Session
-from ..models.models import Memory, DocumentChunk, WorkingMemory
+from ..models.models import Memory, Document, DocumentChunk, WorkingMemory
 from ..core.config import settings
+from .single_flight import ThreadSingleFlight
 import json
 
 class VectorService:
@@ -19,6 +21,12 @@ class VectorService:
         self.vector_store_dir = os.path.join(settings.upload_dir, "vector_store")
         os.makedirs(self.vector_store_dir, exist_ok=True)
 
+        # FAISS索引和ID映射文件的写锁（批量导入时多个线程会同时写入）
+        self._index_lock = threading.Lock()
+
+        # 合并并发的相同embedding计算
+        self._embedding_flight = ThreadSingleFlight()
+
         # 初始化FAISS索引
         self.memory_index = None
         self.document_index = None
@@ -41,7 +49,12 @@ class VectorService:
             self.document_index = faiss.IndexFlatIP(self.embedding_dim)
 
     def text_to_embedding(self, text: str) -> np.ndarray:
-        """将文本转换为embedding向量"""
+        """将文本转换为embedding向量（并发的相同文本只计算一次）"""
+        if settings.llm_single_flight_enabled:
+            return self._embedding_flight.do(text, lambda: self._encode(text))
+        return self._encode(text)
+
+    def _encode(self, text: str) -> np.ndarray:
         embedding = self.embedding_model.encode(text, convert_to_numpy=True)
         # 归一化向量（用于内积相似度计算）
         embedding = embedding / np.linalg.norm(embedding)
@@ -68,11 +81,10 @@ class VectorService:
         try:
             embedding = self.text_to_embedding(content)
 
-            # 添加到FAISS索引
-            self.memory_index.add(embedding.reshape(1, -1))
-
-            # 保存ID映射
-            self._save_id_mapping("memory", memory_id, self.memory_index.ntotal - 1)
+            # 添加到FAISS索引并保存ID映射
+            with self._index_lock:
+                self.memory_index.add(embedding.reshape(1, -1))
+                self._save_id_mapping("memory", memory_id, self.memory_index.ntotal - 1)
 
             # 更新数据库中的embedding
             memory = db.query(Memory).filter(Memory.id == memory_id).first()
@@ -80,7 +92,8 @@ class VectorService:
                 memory.embedding = pickle.dumps(embedding)
                 db.commit()
 
-            self.save_indices()
+            with self._index_lock:
+                self.save_indices()
 
         except Exception as e:
             print(f"Error adding memory embedding: {e}")
@@ -90,11 +103,10 @@ class VectorService:
         try:
             embedding = self.text_to_embedding(content)
 
-            # 添加到FAISS索引
-            self.document_index.add(embedding.reshape(1, -1))
-
-            # 保存ID映射
-            self._save_id_mapping("document", chunk_id, self.document_index.ntotal - 1)
+            # 添加到FAISS索引并保存ID映射
+            with self._index_lock:
+                self.document_index.add(embedding.reshape(1, -1))
+                self._save_id_mapping("document", chunk_id, self.document_index.ntotal - 1)
 
             # 更新数据库中的embedding
             chunk = db.query(DocumentChunk).filter(DocumentChunk.id == chunk_id).first()
@@ -102,13 +114,37 @@ class VectorService:
                 chunk.embedding = pickle.dumps(embedding)
                 db.commit()
 
-            self.save_indices()
+            with self._index_lock:
+                self.save_indices()
 
         except Exception as e:
             print(f"Error adding document chunk embedding: {e}")
 
+    def add_document_chunk_embeddings(self, chunk_ids: List[int], embeddings: np.ndarray):
+        """批量添加文档块到向量索引（embedding已由调用方写入数据库）"""
+        if not chunk_ids:
+            return
+
+        try:
+            with self._index_lock:
+                start = self.document_index.ntotal
+                self.document_index.add(embeddings)
+
+                # 一次性保存ID映射和索引
+                self._save_id_mappings("document", {
+                    start + offset: chunk_id for offset, chunk_id in enumerate(chunk_ids)
+                })
+                self.save_indices()
+
+        except Exception as e:
+            print(f"Error adding document chunk embeddings: {e}")
+
     def _save_id_mapping(self, index_type: str, item_id: int, vector_index: int):
         """保存ID映射关系"""
+        self._save_id_mappings(index_type, {vector_index: item_id})
+
+    def _save_id_mappings(self, index_type: str, items: Dict[int, int]):
+        """批量保存ID映射关系（向量位置 -> 记录ID）"""
         mapping_file = os.path.join(self.vector_store_dir, f"{index_type}_id_mapping.json")
 
         mapping = {}
@@ -116,7 +152,8 @@ class VectorService:
             with open(mapping_file, 'r') as f:
                 mapping = json.load(f)
 
-        mapping[str(vector_index)] = item_id
+        for vector_index, item_id in items.items():
+            mapping[str(vector_index)] = item_id
 
         with open(mapping_file, 'w') as f:
             json.dump(mapping, f)
@@ -191,6 +228,16 @@ class VectorService:
             results = []
             document_mapping = self._load_id_mapping("document")
 
+            # 知识库中可见的文档（含去重引用）：块所属的原始文档ID -> 该知识库中的文档ID
+            visible_documents = None
+            if knowledge_base_ids and db:
+                visible_documents = {}
+                rows = db.query(Document.id, Document.source_document_id).filter(
+                    Document.knowledge_base_id.in_(knowledge_base_ids)
+                ).all()
+                for doc_id, source_id in rows:
+                    visible_documents.setdefault(source_id or doc_id, doc_id)
+
             for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
                 if idx == -1 or distance < threshold:
                     continue
@@ -204,13 +251,17 @@ class VectorService:
                     chunk = db.query(DocumentChunk).filter(DocumentChunk.id == chunk_id).first()
                     if chunk:
                         # 过滤知识库
-                        if knowledge_base_ids and chunk.document.knowledge_base_id not in knowledge_base_ids:
-                            continue
+                        document_id = chunk.document_id
+                        if visible_documents is not None:
+                            if chunk.document_id not in visible_documents:
+                                continue
+                            document_id = visible_documents[chunk.document_id]
 
                         results.append({
                             "id": chunk.id,
                             "content": chunk.content,
-                            "document_id": chunk.document_id,
+                            "document_id": document_id,
+                            "source_document_id": chunk.document_id,
                             "chunk_index": chunk.chunk_index,
                             "score": float(distance),
                             "metadata": chunk.metadata,
@@ -0,0 +1,114 @@
+"""
+LLMService并发压测：测量吞吐量、延迟分位数和流式首token时间
+
+先启动模拟服务，再在 backend 目录下运行:
+    python -m benchmarks.mock_openai_server --port 8100 &
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8100/v1 \\
+        python -m benchmarks.llm_load_benchmark [--requests 500] [--concurrency 100] [--stream]
+        [--duplicate-ratio 0.0] [--lane interactive]
+
+默认每个请求的提示都不同，不会命中响应缓存和请求合并；--duplicate-ratio 控制重复提示的比例。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional
+
+from app.services.llm_service import llm_service
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+async def one_request(index: int, args, rng: random.Random, latencies: List[float],
+                      first_token_latencies: List[float], errors: List[str]):
+    prompt_id = rng.randrange(10) if rng.random() < args.duplicate_ratio else f"unique-{index}"
+    messages = [{"role": "user", "content": f"Benchmark prompt {prompt_id}: summarize the document."}]
+
+    start = time.perf_counter()
+    first_token: Optional[float] = None
+    try:
+        if args.stream:
+            stream = await llm_service.chat_completion(
+                messages, model=args.model, max_tokens=args.max_tokens, temperature=args.temperature,
+                stream=True, priority=args.lane
+            )
+            async with stream:
+                async for _ in stream:
+                    pass
+            first_token = stream.get_timing()["ttft"]
+        else:
+            await llm_service.chat_completion(
+                messages, model=args.model, max_tokens=args.max_tokens, temperature=args.temperature,
+                priority=args.lane
+            )
+    except Exception as e:
+        errors.append(str(e))
+        return
+
+    latencies.append(time.perf_counter() - start)
+    if first_token is not None:
+        first_token_latencies.append(first_token)
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    first_token_latencies: List[float] = []
+    errors: List[str] = []
+
+    async def bounded(index: int):
+        async with semaphore:
+            await one_request(index, args, rng, latencies, first_token_latencies, errors)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(index) for index in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"requests: {args.requests}  concurrency: {args.concurrency}  stream: {args.stream}")
+    print(f"elapsed: {elapsed:.2f} s  throughput: {len(latencies) / elapsed:.1f} req/s  errors: {len(errors)}")
+    print(
+        f"latency  p50 {percentile(latencies, 0.5) * 1000:.0f} ms  "
+        f"p95 {percentile(latencies, 0.95) * 1000:.0f} ms  p99 {percentile(latencies, 0.99) * 1000:.0f} ms"
+    )
+    if first_token_latencies:
+        print(
+            f"ttft     p50 {percentile(first_token_latencies, 0.5) * 1000:.0f} ms  "
+            f"p95 {percentile(first_token_latencies, 0.95) * 1000:.0f} ms"
+        )
+    if errors:
+        print(f"first error: {errors[0]}")
+
+    print(json.dumps({
+        "single_flight": llm_service.get_single_flight_stats(),
+        "resilience": llm_service.get_resilience_stats(),
+        "scheduler": llm_service.get_scheduler_stats(),
+        "usage": llm_service.get_usage_stats()
+    }, indent=2, default=str))
+
+    await llm_service.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test LLMService against an OpenAI-compatible endpoint")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--lane", default="interactive", choices=["interactive", "agent", "background"])
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+本地OpenAI兼容模拟服务，用于在不访问真实API的情况下压测LLMService
+
+支持 LLMService 用到的接口：chat/completions（含流式和图像输入）、embeddings、
+audio/transcriptions、audio/speech。可配置延迟分布、生成速度、错误注入，
+相同请求总是返回相同的内容。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.mock_openai_server [--port 8100] [--latency-ms 300] [--latency-dist lognormal]
+        [--tokens-per-second 50] [--error-rate 0.01] [--error-status 500,429] [--seed 0]
+
+然后设置 OPENAI_BASE_URL=http://127.0.0.1:8100/v1 启动后端或运行 benchmarks.llm_load_benchmark。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+WORDS = [
+    "the", "model", "answer", "context", "knowledge", "retrieval", "agent", "memory",
+    "response", "token", "latency", "stream", "vector", "document", "result", "query",
+    "模型", "回答", "知识", "检索", "上下文", "记忆",
+]
+
+# 各embedding模型的向量维度
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 300.0  # 首个token前的平均延迟
+    latency_dist: str = "lognormal"  # fixed / uniform / normal / lognormal / exponential
+    latency_jitter: float = 0.5  # 分布的离散程度（相对平均值）
+    tokens_per_second: float = 50.0  # 生成速度，0表示瞬间完成
+    completion_tokens: int = 64  # 默认生成的token数（不超过请求的max_tokens）
+    embedding_latency_ms: float = 50.0
+    error_rate: float = 0.0  # 注入错误的概率
+    error_statuses: List[int] = field(default_factory=lambda: [500])
+    retry_after: float = 0.0  # 429时返回的Retry-After（秒），0表示不返回
+    seed: int = 0
+
+
+class MockOpenAI:
+    """模拟服务的状态：配置、随机数和请求统计"""
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stats: Counter = Counter()
+
+    def sample_latency(self, mean_ms: float) -> float:
+        """按配置的分布采样一次延迟（秒）"""
+        if mean_ms <= 0:
+            return 0.0
+        dist, jitter = self.config.latency_dist, self.config.latency_jitter
+        if dist == "uniform":
+            value = self.rng.uniform(mean_ms * (1 - jitter), mean_ms * (1 + jitter))
+        elif dist == "normal":
+            value = self.rng.gauss(mean_ms, mean_ms * jitter)
+        elif dist == "exponential":
+            value = self.rng.expovariate(1.0 / mean_ms)
+        elif dist == "lognormal":
+            # 保持均值为mean_ms的对数正态分布，长尾明显
+            sigma = jitter
+            value = self.rng.lognormvariate(math.log(mean_ms) - sigma ** 2 / 2, sigma)
+        else:
+            value = mean_ms
+        return max(0.0, value) / 1000.0
+
+    def maybe_error(self, endpoint: str):
+        """按错误率返回一个OpenAI格式的错误响应，否则返回None"""
+        if self.config.error_rate <= 0 or self.rng.random() >= self.config.error_rate:
+            return None
+        status = self.rng.choice(self.config.error_statuses)
+        self.stats[f"{endpoint}.errors"] += 1
+        headers = {}
+        if status == 429 and self.config.retry_after > 0:
+            headers["retry-after"] = str(self.config.retry_after)
+        return JSONResponse(
+            status_code=status,
+            headers=headers,
+            content={"error": {"message": f"Injected error {status}", "type": "mock_error", "code": status}}
+        )
+
+
+def request_seed(*parts: Any) -> int:
+    """由请求内容得到稳定的随机种子，保证相同请求输出相同"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "big")
+
+
+def message_text(messages: List[Dict[str, Any]]) -> str:
+    """拼接消息中的文本（图像输入只计入文本部分）"""
+    texts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(texts)
+
+
+def completion_words(body: Dict[str, Any], config: MockConfig) -> List[str]:
+    rng = random.Random(request_seed(body.get("model"), body.get("messages"), config.seed))
+    count = min(config.completion_tokens, body.get("max_tokens") or config.completion_tokens)
+    return [rng.choice(WORDS) for _ in range(max(1, count))]
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI API")
+    mock = MockOpenAI(config)
+
+    @app.get("/v1/models")
+    async def list_models():
+        models = ["gpt-3.5-turbo", "gpt-4", "gpt-4-vision-preview", "whisper-1", "tts-1", *EMBEDDING_DIMENSIONS]
+        return {"object": "list", "data": [{"id": name, "object": "model", "owned_by": "mock"} for name in models]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(mock.stats)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        mock.stats["chat.requests"] += 1
+        error = mock.maybe_error("chat")
+        if error:
+            return error
+
+        model = body.get("model", "gpt-3.5-turbo")
+        words = completion_words(body, config)
+        prompt_tokens = len(message_text(body.get("messages", [])).split())
+        completion_id = f"chatcmpl-mock-{request_seed(body) % 10 ** 12}"
+        created = int(time.time())
+        token_delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        first_token_delay = mock.sample_latency(config.latency_ms)
+
+        if body.get("stream"):
+            mock.stats["chat.streams"] += 1
+
+            async def events():
+                await asyncio.sleep(first_token_delay)
+                for index, word in enumerate(words):
+                    delta = {"content": (" " if index else "") + word}
+                    if index == 0:
+                        delta["role"] = "assistant"
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(token_delay)
+                final = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(first_token_delay + token_delay * len(words))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words)
+            }
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        mock.stats["embeddings.requests"] += 1
+        error = mock.maybe_error("embeddings")
+        if error:
+            return error
+
+        model = body.get("model", "text-embedding-ada-002")
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        mock.stats["embeddings.inputs"] += len(inputs)
+        dimension = EMBEDDING_DIMENSIONS.get(model, 1536)
+
+        data = []
+        for index, text in enumerate(inputs):
+            rng = random.Random(request_seed(model, text, config.seed))
+            vector = [rng.gauss(0, 1) for _ in range(dimension)]
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            data.append({"object": "embedding", "index": index, "embedding": [value / norm for value in vector]})
+
+        await asyncio.sleep(mock.sample_latency(config.embedding_latency_ms))
+        tokens = sum(len(str(text).split()) for text in inputs)
+        return {"object": "list", "data": data, "model": model,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        form = await request.form()
+        mock.stats["transcriptions.requests"] += 1
+        error = mock.maybe_error("transcriptions")
+        if error:
+            return error
+
+        audio = await form["file"].read()
+        rng = random.Random(request_seed(hashlib.sha256(audio).hexdigest(), config.seed))
+        await asyncio.sleep(mock.sample_latency(config.latency_ms))
+        return {"text": " ".join(rng.choice(WORDS) for _ in range(20))}
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        mock.stats["speech.requests"] += 1
+        error = mock.maybe_error("speech")
+        if error:
+            return error
+
+        # 伪造的音频数据，长度与文本长度成正比
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).digest()
+        audio = digest * max(1, len(body.get("input", "")) // 4)
+        await asyncio.sleep(mock.sample_latency(config.latency_ms))
+        return Response(content=audio, media_type="audio/mpeg")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-dist", default="lognormal",
+                        choices=["fixed", "uniform", "normal", "lognormal", "exponential"])
+    parser.add_argument("--latency-jitter", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", default="500", help="逗号分隔的错误状态码，如 500,429")
+    parser.add_argument("--retry-after", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        latency_jitter=args.latency_jitter,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        embedding_latency_ms=args.embedding_latency_ms,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_status.split(",") if status],
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
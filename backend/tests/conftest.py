@@ -0,0 +1,4 @@
+import os
+
+# 配置在导入时校验必填项，测试不访问真实的OpenAI接口
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
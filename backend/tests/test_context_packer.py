@@ -0,0 +1,57 @@
+from app.services.context_packer import ContextPacker
+
+
+class WordChunker:
+    """按空白分词计数，测试不依赖tiktoken的BPE文件"""
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+def chunk(content: str, score: float, chunk_index: int, document_id: int = 1):
+    return {"content": content, "score": score, "document_id": document_id, "chunk_index": chunk_index}
+
+
+def test_higher_scoring_half_is_kept_when_merged_pair_does_not_fit():
+    packer = ContextPacker(WordChunker())
+    items = [
+        chunk("one two three four five", 0.9, 0),
+        chunk("six seven eight nine ten", 0.8, 1),
+    ]
+
+    packing = packer.pack(items, budget=6)
+
+    assert [item["content"] for item in packing["items"]] == ["one two three four five"]
+    assert packing["tokens_used"] == 5
+    assert packing["tokens_dropped"] == 5
+    assert packing["tokens_saved"] == 0
+    assert packing["dropped"] == 1
+
+
+def test_adjacent_chunks_are_merged_after_packing():
+    packer = ContextPacker(WordChunker())
+    items = [
+        chunk("alpha beta gamma delta", 0.9, 0),
+        chunk("epsilon zeta eta theta", 0.7, 1),
+        chunk("unrelated chunk text", 0.8, 5),
+    ]
+
+    packing = packer.pack(items, budget=100)
+
+    assert len(packing["items"]) == 2
+    assert packing["items"][0]["content"] == "alpha beta gamma delta\nepsilon zeta eta theta"
+    assert packing["items"][0]["last_chunk_index"] == 1
+    assert packing["tokens_dropped"] == 0
+
+
+def test_duplicates_count_as_saved_not_dropped():
+    packer = ContextPacker(WordChunker())
+    items = [
+        chunk("same text here", 0.9, 0, document_id=1),
+        chunk("same text here", 0.8, 3, document_id=2),
+    ]
+
+    packing = packer.pack(items, budget=100)
+
+    assert packing["tokens_used"] == 3
+    assert packing["tokens_saved"] == 3
+    assert packing["tokens_dropped"] == 0
@@ -0,0 +1,28 @@
+from app.services.llm_cache import SQLiteCacheBackend
+
+
+def test_sqlite_backend_evicts_least_recently_used_to_low_water(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_entries=10)
+    for i in range(10):
+        assert backend.set(f"k{i}", "v", 60) == 0
+    backend.get("k0")
+
+    # 超出容量时淘汰到低水位，最近访问过的条目保留
+    assert backend.set("k10", "v", 60) == 2
+    assert backend.size() == 9
+    assert backend.get("k0") == "v"
+    assert backend.get("k1") is None
+
+    # 覆盖已有键不会让条目数增长，也不会触发淘汰
+    assert backend.set("k10", "v2", 60) == 0
+    assert backend.size() == 9
+
+
+def test_sqlite_backend_counts_existing_entries_on_open(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = SQLiteCacheBackend(path, max_entries=5)
+    backend.set_many({f"k{i}": "v" for i in range(5)}, 60)
+
+    reopened = SQLiteCacheBackend(path, max_entries=5)
+    assert reopened.set("k5", "v", 60) == 2
+    assert reopened.size() == 4
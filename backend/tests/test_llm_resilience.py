@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+import openai
+
+from app.services.llm_resilience import LLMResilience, CircuitBreaker
+
+
+def make_status_error(status_code: int) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, request=request)
+    return openai.APIStatusError("upstream error", response=response, body=None)
+
+
+def half_open_resilience(model: str) -> LLMResilience:
+    """熔断器已打开且冷却结束，下一个请求就是半开状态的探测请求"""
+    resilience = LLMResilience()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    resilience._breakers[model] = breaker
+    return resilience
+
+
+async def ok(model: str) -> str:
+    return f"ok from {model}"
+
+
+def test_non_retryable_probe_error_closes_the_breaker():
+    async def scenario():
+        resilience = half_open_resilience("m")
+
+        async def bad_request(model: str):
+            raise make_status_error(400)
+
+        try:
+            await resilience.call("m", bad_request, fallback=False)
+        except openai.APIStatusError as e:
+            assert e.status_code == 400
+        else:
+            raise AssertionError("expected the 400 to propagate")
+
+        assert resilience.breaker_for("m").state == CircuitBreaker.CLOSED
+        assert await resilience.call("m", ok, fallback=False) == "ok from m"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_releases_the_half_open_slot():
+    async def scenario():
+        resilience = half_open_resilience("m")
+
+        async def hang(model: str):
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(resilience.call("m", hang, fallback=False))
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        breaker = resilience.breaker_for("m")
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert await resilience.call("m", ok, fallback=False) == "ok from m"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
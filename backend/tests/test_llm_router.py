@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.llm_router import LLMRouter
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(settings, "llm_router_enabled", True)
+    monkeypatch.setattr(settings, "llm_router_min_samples", 5)
+    monkeypatch.setattr(settings, "llm_routes", {
+        "interactive": {"models": ["primary-model", "backup-model"], "policy": "fastest_under_slo", "slo_ms": 1000},
+    })
+    return LLMRouter()
+
+
+def observe(router: LLMRouter, model: str, latency: float, count: int = 10):
+    for _ in range(count):
+        router.observe(model, latency, True)
+
+
+def test_healthy_primary_stays_first(router):
+    observe(router, "primary-model", 0.5)
+    observe(router, "backup-model", 0.1)
+
+    assert router.candidates("interactive", "primary-model") == ["primary-model", "backup-model"]
+
+
+def test_primary_over_slo_is_demoted(router):
+    observe(router, "primary-model", 3.0)
+    observe(router, "backup-model", 0.2)
+
+    assert router.candidates("interactive", "primary-model") == ["backup-model", "primary-model"]
+
+
+def test_degraded_primary_is_skipped(router):
+    observe(router, "primary-model", 3.0)
+    observe(router, "backup-model", 0.2)
+    called = []
+
+    async def func(model: str):
+        called.append(model)
+        return model
+
+    result = asyncio.run(router.call("interactive", "primary-model", func))
+
+    assert result == "backup-model"
+    assert called == ["backup-model"]
+
+
+def test_unrouted_request_uses_only_the_requested_model(router):
+    assert router.candidates(None, "primary-model") == ["primary-model"]
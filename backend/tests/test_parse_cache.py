@@ -0,0 +1,13 @@
+from app.services.parse_cache import CompressedDiskCache, ParsedTextCache
+
+
+def test_namespaces_do_not_share_entries(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    text_cache = ParsedTextCache(cache_dir=cache_dir, max_bytes=1024 * 1024)
+    image_cache = CompressedDiskCache(cache_dir, 1024 * 1024, namespace="image")
+
+    text_cache.put("abc:v1", "parsed text")
+    image_cache.put("abc:v1", "data:image/jpeg;base64,AAAA")
+
+    assert text_cache.get("abc:v1") == "parsed text"
+    assert image_cache.get("abc:v1") == "data:image/jpeg;base64,AAAA"
@@ -0,0 +1,76 @@
+import asyncio
+
+from app.services.single_flight import StreamSingleFlight
+
+
+def make_opener(opened, chunks=("a", "b", "c"), delay=0.01):
+    async def opener():
+        opened.append(1)
+
+        async def upstream():
+            for chunk in chunks:
+                await asyncio.sleep(delay)
+                yield chunk
+
+        return upstream()
+    return opener
+
+
+async def collect(subscription, timeout=2.0):
+    async def read():
+        return [chunk async for chunk in subscription]
+    return await asyncio.wait_for(read(), timeout)
+
+
+def test_close_before_pump_starts_does_not_block_later_requests():
+    async def scenario():
+        flight = StreamSingleFlight()
+        opened = []
+
+        subscription = flight.subscribe("key", make_opener(opened))
+        # 泵任务还没有执行第一步就退出订阅
+        await subscription.aclose()
+        assert flight.get_stats()["in_flight"] == 0
+
+        chunks = await collect(flight.subscribe("key", make_opener(opened)))
+        assert chunks == ["a", "b", "c"]
+        assert flight.get_stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_request_arriving_while_stream_is_cancelled_gets_a_full_stream():
+    async def scenario():
+        flight = StreamSingleFlight()
+        opened = []
+
+        first = flight.subscribe("key", make_opener(opened))
+        iterator = first.__aiter__()
+        assert await iterator.__anext__() == "a"
+
+        # 最后一个订阅者退出后，泵任务的finally还没执行时相同的请求到达
+        await iterator.aclose()
+        chunks = await collect(flight.subscribe("key", make_opener(opened)))
+
+        assert chunks == ["a", "b", "c"]
+        assert len(opened) == 2
+        await asyncio.sleep(0.05)
+        assert flight.get_stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_subscribers_share_one_upstream():
+    async def scenario():
+        flight = StreamSingleFlight()
+        opened = []
+
+        results = await asyncio.gather(
+            collect(flight.subscribe("key", make_opener(opened))),
+            collect(flight.subscribe("key", make_opener(opened)))
+        )
+
+        assert results == [["a", "b", "c"], ["a", "b", "c"]]
+        assert len(opened) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.core.upload_limit import UploadSizeLimitMiddleware, MULTIPART_OVERHEAD_BYTES
+
+LIMIT = 1024
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, max_body_size=LIMIT,
+                       path_limits={r"^/archive$": LIMIT * 1024})
+    handled = []
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        handled.append(file.filename)
+        return {"size": len(await file.read())}
+
+    @app.post("/archive")
+    async def archive(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    client = TestClient(app)
+    client.handled = handled
+    return client
+
+
+def test_small_upload_passes():
+    client = make_client()
+    response = client.post("/upload", files={"file": ("a.txt", b"x" * 100)})
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_oversized_upload_is_rejected_before_the_handler_runs():
+    client = make_client()
+    payload = b"x" * (LIMIT + MULTIPART_OVERHEAD_BYTES + 1)
+    response = client.post("/upload", files={"file": ("a.txt", payload)})
+    assert response.status_code == 413
+    assert client.handled == []
+
+
+def test_oversized_chunked_upload_is_rejected_while_streaming():
+    client = make_client()
+    boundary = "testboundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.txt\"\r\n\r\n".encode()
+        + b"x" * (LIMIT + MULTIPART_OVERHEAD_BYTES + 1)
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+
+    def chunks():
+        for start in range(0, len(body), 4096):
+            yield body[start:start + 4096]
+
+    response = client.post("/upload", content=chunks(),
+                           headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+    assert client.handled == []
+
+
+def test_path_specific_limit():
+    client = make_client()
+    response = client.post("/archive", files={"file": ("a.zip", b"x" * (LIMIT * 10))})
+    assert response.status_code == 200